@@ -24,9 +24,25 @@
 
 ## import all necessary packages and functions.
 import csv # read and write csv files
-from datetime import datetime # operations to parse dates
-from pprint import pprint # use to print data structures like dictionaries in
-                          # a nicer way than the base print function.
+import hashlib # file fingerprints for the result cache
+import io # in-memory text buffers for byte-range chunks
+import json # sidecar metadata
+import locale # default text encoding when decoding raw chunks
+import os
+import pickle # on-disk result cache
+import random # seeded sampling
+import re # timestamp format directives
+import shutil # merging condensed chunks
+import sys # platform check for peak RSS units
+import tempfile # private temporary files for result cache writes
+import time # timing of the condense stage
+from array import array # compact typed column buffers
+from bisect import bisect_right # histogram binning
+from collections import namedtuple # light-weight typed result records
+from datetime import date, datetime # operations to parse dates
+from functools import lru_cache, wraps # memoized lookups and the result cache
+from itertools import count, islice # fixed-size batches of rows, sampling skips
+from math import ceil, exp, floor, log, sqrt # sketch buckets, sampling and intervals
 
 
 def print_first_point(filename):
@@ -34,6 +50,9 @@ def print_first_point(filename):
     This function prints and returns the first data point (second row) from
     a csv file that includes a header row.
     """
+    from pprint import pprint # use to print data structures like dictionaries in
+                              # a nicer way than the base print function.
+
     # print city name for reference
     city = filename.split('-')[0].split('/')[-1]
     print('\nCity: {}'.format(city))
@@ -61,15 +80,122 @@ data_files = ['./data/NYC-CitiBike-2016.csv',
               './data/Chicago-Divvy-2016.csv',
               './data/Washington-CapitalBikeshare-2016.csv',]
 
-# print the first trip from each file, store in dictionary
-example_trips = {}
-for data_file in data_files:
-    city, first_trip = print_first_point(data_file)
-    example_trips[city] = first_trip
+
+# how each city lays out its raw trip data. A new city is added by adding an
+# entry here:
+#   duration          - column holding the trip duration
+#   duration_unit     - 'seconds' or 'milliseconds'
+#   start_time        - column holding the trip start timestamp
+#   time_format       - strptime format of start_time
+#   user_type         - column holding the type of user
+#   user_types        - raw label -> 'Subscriber' / 'Customer'
+#   other_user_type   - label for values missing from user_types; None keeps
+#                       the raw value
+#   start_station     - column holding the origin station id
+#   end_station       - column holding the destination station id
+city_schemas = {
+    'NYC': {'duration': 'tripduration', 'duration_unit': 'seconds',
+            'start_time': 'starttime', 'time_format': "%m/%d/%Y %H:%M:%S",
+            'user_type': 'usertype', 'user_types': {}, 'other_user_type': None,
+            'start_station': 'start station id', 'end_station': 'end station id'},
+    'Chicago': {'duration': 'tripduration', 'duration_unit': 'seconds',
+                'start_time': 'starttime', 'time_format': "%m/%d/%Y %H:%M",
+                'user_type': 'usertype', 'user_types': {}, 'other_user_type': None,
+                'start_station': 'from_station_id', 'end_station': 'to_station_id'},
+    'Washington': {'duration': 'Duration (ms)', 'duration_unit': 'milliseconds',
+                   'start_time': 'Start date', 'time_format': "%m/%d/%Y %H:%M",
+                   'user_type': 'Member Type', 'user_types': {'Registered': 'Subscriber'},
+                   'other_user_type': 'Customer',
+                   'start_station': 'Start station number', 'end_station': 'End station number'},
+}
+
+# divisor turning each duration unit into minutes #
+duration_divisors = {'seconds': 60, 'milliseconds': 60000}
+
+
+def city_schema(city):
+    """
+    Returns the city_schemas entry of a city, raising ValueError for a city
+    that has not been configured.
+    """
+    try:
+        return city_schemas[city]
+    except KeyError:
+        raise ValueError('unknown city {!r}, expected one of {}'
+                         .format(city, ', '.join(city_schemas))) from None
+
+
+def map_user_type(schema, value):
+    """
+    Maps a raw user type label to its reported name following the schema.
+    """
+    other = schema['other_user_type']
+    return schema['user_types'].get(value, value if other is None else other)
+
+
+def compile_batch_reader(city, header, station_codes=None):
+    """
+    Builds a batch reader for a city's raw file from its header row. The
+    returned function takes a positional csv.reader and a batch size and
+    returns a TripBatch of up to that many condensed trips, empty at the end
+    of the file. Column positions, the duration divisor, the timestamp parser
+    and the user type mapping are all resolved here, once per file, and the
+    values go straight into the batch's typed columns without any per-row
+    record objects.
+
+    When a station_codes dict is passed, the origin and destination station
+    ids are also read, interned into station_codes (id -> code) and stored
+    in the batch's origins and destinations columns.
+    """
+    schema = city_schema(city)
+    i_dur = header.index(schema['duration'])
+    i_time = header.index(schema['start_time'])
+    i_user = header.index(schema['user_type'])
+    divisor = duration_divisors[schema['duration_unit']]
+    parse_time = compile_time_parser(schema['time_format'])
+    user_get = schema['user_types'].get
+    other = schema['other_user_type']
+    if station_codes is not None:
+        i_origin = header.index(schema['start_station'])
+        i_destination = header.index(schema['end_station'])
+
+    def station_code(station):
+        code = station_codes.get(station)
+        if code is None:
+            code = station_codes[station] = len(station_codes)
+        return code
+
+    def read_batch(trip_reader, batch_size):
+        batch = TripBatch()
+        add_duration = batch.durations.append
+        add_month = batch.months.append
+        add_hour = batch.hours.append
+        add_day = batch.days_of_week.append
+        add_user = batch.user_codes.append
+        add_origin = batch.origins.append
+        add_destination = batch.destinations.append
+        user_codes = batch.user_code_of
+        # blank lines come back as [] and are skipped, as csv.DictReader does #
+        for row in islice(filter(None, trip_reader), batch_size):
+            month, hour, day_of_week = parse_time(row[i_time])
+            user_type = row[i_user]
+            user_type = user_get(user_type, user_type if other is None else other)
+            code = user_codes.get(user_type)
+            if code is None:
+                code = batch.add_user_type(user_type)
+            add_duration(int(row[i_dur]) / divisor)
+            add_month(month)
+            add_hour(hour)
+            add_day(weekday_codes[day_of_week])
+            add_user(code)
+            if station_codes is not None:
+                add_origin(station_code(row[i_origin]))
+                add_destination(station_code(row[i_destination]))
+        return batch
+    return read_batch
 
 
 
-datum = {}
 def duration_in_mins(datum, city):
     """
     Takes as input a dictionary containing info about a single trip (datum) and
@@ -78,21 +204,73 @@ def duration_in_mins(datum, city):
     Remember that Washington is in terms of milliseconds while Chicago and NYC
     are in terms of seconds. 
     
-    HINT: The csv module reads in all of the data as strings, including numeric
-    values. You will need a function to convert the strings into an appropriate
-    numeric type when making your transformations.
-    see https://docs.python.org/3/library/functions.html
+    The column and unit of each city come from city_schemas.
     """
-    
-    if city == 'NYC':
-        duration = int(datum['tripduration']) /60
-    elif city == 'Chicago':
-        duration = int(datum['tripduration']) /60
-    else:
-        duration = int(datum['Duration (ms)']) /60000
-    return duration
+    schema = city_schema(city)
+    return int(datum[schema['duration']]) / duration_divisors[schema['duration_unit']]
+
+
+
+weekday_names = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+                 'Saturday', 'Sunday')
+weekday_codes = {name: code for code, name in enumerate(weekday_names)}
 
 
+def _split_format(fmt):
+    """
+    Splits a format such as "%m/%d/%Y" into its separator and directives,
+    raising ValueError for layouts the fast parser does not handle.
+    """
+    fields = re.findall('%.', fmt)
+    seps = set(re.sub('%.', '', fmt))
+    if len(seps) == 1:
+        sep = seps.pop()
+        if fmt == sep.join(fields):
+            return sep, fields
+    raise ValueError('unsupported timestamp layout: {!r}'.format(fmt))
+
+
+@lru_cache(maxsize=None)
+def compile_time_parser(fmt):
+    """
+    Takes a strptime format and returns a function that turns a timestamp
+    string in that format into a (month, hour, day_of_week) tuple.
+
+    Formats made of %m/%d/%Y style date fields and %H:%M(:%S) time fields
+    are compiled into plain string splits, with the month and weekday
+    memoized per date string, so strptime/strftime never run per row. Any
+    other format falls back to datetime.strptime. Each format is compiled
+    only once.
+    """
+    try:
+        date_fmt, time_fmt = fmt.split(' ')
+        date_sep, date_fields = _split_format(date_fmt)
+        time_sep, time_fields = _split_format(time_fmt)
+        i_month = date_fields.index('%m')
+        i_day = date_fields.index('%d')
+        i_year = date_fields.index('%Y')
+        i_hour = time_fields.index('%H')
+    except ValueError:
+        def parse_time(value):
+            d = datetime.strptime(value, fmt)
+            return (d.month, d.hour, weekday_names[d.weekday()])
+        return parse_time
+
+    # a year of trips only has a few hundred distinct dates #
+    @lru_cache(maxsize=4096)
+    def month_and_weekday(date_str):
+        parts = date_str.split(date_sep)
+        month = int(parts[i_month])
+        day_of_week = weekday_names[date(int(parts[i_year]), month, int(parts[i_day])).weekday()]
+        return month, day_of_week
+
+    def parse_time(value):
+        date_str, time_str = value.split(' ')
+        month, day_of_week = month_and_weekday(date_str)
+        return (month, int(time_str.split(time_sep)[i_hour]), day_of_week)
+
+    return parse_time
+
 
 def time_of_trip(datum, city):
     """
@@ -102,29 +280,11 @@ def time_of_trip(datum, city):
     
     Remember that NYC includes seconds, while Washington and Chicago do not.
     
-    HINT: You should use the datetime module to parse the original date
-    strings into a format that is useful for extracting the desired information.
-    see https://docs.python.org/3/library/datetime.html#strftime-and-strptime-behavior
-    """
-    if city == 'NYC':        
-        d1 = datetime.strptime((datum['starttime']), "%m/%d/%Y %H:%M:%S")
-        month = int(d1.strftime("%m"))
-        hour = int(d1.strftime("%H"))
-        day_of_week=d1.strftime("%A")
-          
-    elif city =='Chicago':
-        d2 = datetime.strptime((datum['starttime']), "%m/%d/%Y %H:%M")
-        month = int(d2.strftime("%m"))
-        hour = int(d2.strftime("%H"))
-        day_of_week=d2.strftime("%A")
-        
-    else:
-        d3 = datetime.strptime((datum['Start date']), "%m/%d/%Y %H:%M")
-        month = int(d3.strftime("%m"))
-        hour = int(d3.strftime("%H"))
-        day_of_week=d3.strftime("%A")    
-        
-    return (month, hour, day_of_week)
+    The timestamp is handled by the parser compiled for the city's format in
+    city_schemas, see compile_time_parser().
+    """
+    schema = city_schema(city)
+    return compile_time_parser(schema['time_format'])(datum[schema['start_time']])
 
 
 
@@ -135,64 +295,637 @@ def type_of_user(datum, city):
     trip.
     
     Remember that Washington has different category names compared to Chicago
-    and NYC. 
+    and NYC. The mapping of each city is declared in city_schemas.
     """
-    
-    if city =='NYC':
-        user_type = str(datum['usertype'])
-    elif city == 'Chicago':
-        user_type = str(datum['usertype'])
-    else:
-        if datum['Member Type'] == "Registered":
-            user_type = 'Subscriber'
-        else:
-            user_type = 'Customer'
-            
-    return user_type
+    schema = city_schema(city)
+    return map_user_type(schema, datum[schema['user_type']])
+
+
+
+# ## Instrumentation
+# 
+# Pipeline functions are wrapped with @instrumented. While a profile is
+# running (start_profile() ... stop_profile()) every call adds its time to a
+# per-stage total, and the functions add their row and byte counts through
+# record_io(). With no profile running the wrapper only checks one global,
+# so the overhead is negligible.
+
+# the running profile, None when instrumentation is off #
+active_profile = None
+
+
+def start_profile(cprofile=False, memory=False):
+    """
+    Starts collecting a per-run profile. cprofile=True also runs cProfile
+    over the run and memory=True traces allocations with tracemalloc.
+    Raises RuntimeError when a profile is already running, since the two
+    would share one set of stages.
+    """
+    global active_profile
+    if active_profile is not None:
+        raise RuntimeError('a profile is already running; stop it first')
+    profile = {'started': time.time(), 'clock': time.perf_counter(), 'stages': {},
+               'profiler': None, 'memory': memory}
+    if cprofile:
+        import cProfile
+        profile['profiler'] = cProfile.Profile()
+        profile['profiler'].enable()
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+    active_profile = profile
+    return profile
+
+
+def stop_profile(top=15):
+    """
+    Stops the running profile and returns it as a JSON-ready dict: the total
+    time, the per-stage calls, seconds, rows and bytes, and when enabled the
+    top functions by cumulative time and the top allocation sites.
+    """
+    global active_profile
+    profile, active_profile = active_profile, None
+    if profile is None:
+        raise RuntimeError('no profile is running')
+
+    result = {'started': profile['started'],
+              'seconds': time.perf_counter() - profile['clock'],
+              'stages': profile['stages']}
+
+    if profile['profiler'] is not None:
+        import pstats
+        profile['profiler'].disable()
+        stats = pstats.Stats(profile['profiler']).stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        result['cprofile'] = [{'function': '{}:{}({})'.format(*key), 'calls': value[1],
+                               'tottime': value[2], 'cumtime': value[3]}
+                              for key, value in ranked]
+
+    if profile['memory']:
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        result['memory_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result['memory_top'] = [{'location': str(stat.traceback), 'bytes': stat.size,
+                                 'blocks': stat.count}
+                                for stat in snapshot.statistics('lineno')[:top]]
+    return result
+
+
+def _profile_stage(name):
+    stages = active_profile['stages']
+    stage = stages.get(name)
+    if stage is None:
+        stage = stages[name] = {'calls': 0, 'seconds': 0.0}
+    return stage
+
+
+def record_io(name, **counters):
+    """
+    Adds counters such as rows, bytes_read or bytes_written to a stage of
+    the running profile; does nothing when no profile is running.
+    """
+    if active_profile is None:
+        return
+    stage = _profile_stage(name)
+    for key, value in counters.items():
+        stage[key] = stage.get(key, 0) + value
+
+
+def instrumented(func):
+    """
+    Decorator timing each call of a pipeline function as a stage named
+    after the function, whenever a profile is running.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if active_profile is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if active_profile is not None:
+                stage = _profile_stage(name)
+                stage['calls'] += 1
+                stage['seconds'] += time.perf_counter() - start
+    return wrapper
+
+
+def format_profile(profile):
+    """
+    Returns a text summary of a profile from stop_profile().
+    """
+    total = profile['seconds']
+    lines = ['run took {:.3f}s (stage times include nested stages)'.format(total),
+             '{:<28} {:>6} {:>9} {:>6} {:>11} {:>12} {:>10} {:>10}'.format(
+                 'stage', 'calls', 'seconds', '%', 'rows', 'rows/sec', 'MB read', 'MB written')]
+    for name, stage in sorted(profile['stages'].items(), key=lambda item: -item[1]['seconds']):
+        seconds = stage['seconds']
+        rows = stage.get('rows')
+        lines.append('{:<28} {:>6} {:>9.3f} {:>5.1f}% {:>11} {:>12} {:>10.1f} {:>10.1f}'.format(
+            name, stage['calls'], seconds, 100 * _ratio(seconds, total),
+            '' if rows is None else rows,
+            '' if rows is None or not seconds else '{:.0f}'.format(rows / seconds),
+            stage.get('bytes_read', 0) / 2**20, stage.get('bytes_written', 0) / 2**20))
+    if 'cprofile' in profile:
+        lines.append('top functions by cumulative time:')
+        for entry in profile['cprofile']:
+            lines.append('  {:>9.3f}s {:>10} calls  {}'.format(entry['cumtime'], entry['calls'],
+                                                               entry['function']))
+    if 'memory_peak_bytes' in profile:
+        lines.append('peak traced memory: {:.1f} MB'.format(profile['memory_peak_bytes'] / 2**20))
+        for entry in profile['memory_top']:
+            lines.append('  {:>10.1f} KB  {}'.format(entry['bytes'] / 2**10, entry['location']))
+    return '\n'.join(lines)
+
+
+def write_profile(profile, json_file):
+    """
+    Writes a profile from stop_profile() to json_file and its text summary
+    next to it, with a .txt extension.
+    """
+    with open(json_file, 'w') as f_out:
+        json.dump(profile, f_out, indent=2)
+    with open(os.path.splitext(json_file)[0] + '.txt', 'w') as f_out:
+        f_out.write(format_profile(profile) + '\n')
+
+
+
+class TripBatch:
+    """
+    A batch of condensed trips stored column-wise in typed arrays: the
+    duration as a double (so the written minutes are exactly those of the
+    original float) and month, hour, weekday code and user type code as
+    single bytes, about 12 bytes per trip. User type labels are interned
+    per batch in user_types. When stations are read, origins and
+    destinations hold the station codes as unsigned ints.
+    """
+    __slots__ = ('durations', 'months', 'hours', 'days_of_week', 'user_codes',
+                 'user_types', 'user_code_of', 'origins', 'destinations')
+
+    def __init__(self):
+        self.durations = array('d')
+        self.months = array('B')
+        self.hours = array('B')
+        self.days_of_week = array('B')
+        self.user_codes = array('B')
+        self.user_types = []
+        self.user_code_of = {}
+        self.origins = array('I')
+        self.destinations = array('I')
+
+    def __len__(self):
+        return len(self.durations)
+
+    def add_user_type(self, user_type):
+        """
+        Interns a user type label and returns its code.
+        """
+        code = self.user_code_of.get(user_type)
+        if code is None:
+            code = self.user_code_of[user_type] = len(self.user_types)
+            self.user_types.append(user_type)
+        return code
+
+    def lines(self):
+        """
+        Iterator over the condensed csv lines of the batch.
+        """
+        return map("{},{},{},{},{}\n".format, self.durations, self.months, self.hours,
+                   map(weekday_names.__getitem__, self.days_of_week),
+                   map(self.user_types.__getitem__, self.user_codes))
+
+    def tally_rows(self):
+        """
+        Iterator over the (duration, month, user_type) tuples tally_trips()
+        takes.
+        """
+        return zip(self.durations, self.months, map(self.user_types.__getitem__, self.user_codes))
+
+
+def trip_batches(trip_reader, read_batch, batch_size):
+    """
+    Generator of the TripBatches read from trip_reader with a
+    compile_batch_reader() function, so rows are never held in memory
+    beyond one batch.
+    """
+    while True:
+        batch = read_batch(trip_reader, batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None on
+    platforms without the resource module.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes #
+    return rss if sys.platform == 'darwin' else rss * 1024
+
 
+def write_condensed_header(f_out):
+    """
+    Writes the header row of a condensed summary file.
+    """
+    # set up csv DictWriter object - writer requires column names for the
+    # first row as the "fieldnames" argument
+    out_colnames = ['duration', 'month', 'hour', 'day_of_week', 'user_type']
+    trip_writer = csv.DictWriter(f_out, fieldnames = out_colnames)
+    trip_writer.writeheader()
+
+
+CondenseStats = namedtuple('CondenseStats', ['rows', 'seconds', 'rows_per_sec', 'peak_rss'])
 
 
-def condense_data(in_file, out_file, city):
+def condense_stats(city, n_rows, start, report=False):
+    """
+    Returns the CondenseStats of a condense run that started at start (a
+    time.perf_counter() value) and wrote n_rows, printing them when report
+    is set. Shared by the condense backends.
+    """
+    elapsed = time.perf_counter() - start
+    stats = CondenseStats(n_rows, elapsed, n_rows / elapsed if elapsed else 0, peak_rss())
+    if report:
+        rss = 'n/a' if stats.peak_rss is None else '{:.1f} MB'.format(stats.peak_rss / 2**20)
+        print('{}: condensed {} rows in {:.2f}s ({:.0f} rows/sec), peak RSS {}'
+              .format(city, stats.rows, stats.seconds, stats.rows_per_sec, rss))
+    return stats
+
+
+@instrumented
+def condense_data(in_file, out_file, city, batch_size=10000, report=False, sidecar=False,
+                  stations=False):
     """
     This function takes full data from the specified input file
     and writes the condensed data to a specified output file. The city
     argument determines how the input file will be parsed.
-    
-    HINT: See the cell below to see how the arguments are structured!
+
+    Rows are streamed through a generator and written out batch_size lines
+    at a time, so memory stays bounded regardless of the input size. Returns
+    a CondenseStats tuple with the row count, elapsed time, rows/sec and
+    peak RSS; report=True also prints them.
+
+    sidecar=True also collects the trip records while streaming and writes
+    the binary .npy sidecar that load_trip_table() memory-maps instead of
+    parsing the csv. stations=True also keeps the
+    origin and destination stations and writes the station and route index
+    that load_station_index() reads (see new_station_tally()).
     """
-    import csv
+    start = time.perf_counter()
+    n_rows = 0
+    station_tally = new_station_tally() if stations else None
+    trip_columns = new_trip_columns() if sidecar else None
     with open(out_file, 'w') as f_out, open(in_file, 'r') as f_in:
-        # set up csv DictWriter object - writer requires column names for the
-        # first row as the "fieldnames" argument
-        out_colnames = ['duration', 'month', 'hour', 'day_of_week', 'user_type']        
-        trip_writer = csv.DictWriter(f_out, fieldnames = out_colnames)
-        trip_writer.writeheader()
-        
-        ## TODO: set up csv DictReader object ##
-        trip_reader = list(csv.DictReader(f_in)) 
-
-        # collect data from and process each row
-        for row in trip_reader:
-            # set up a dictionary to hold the values for the cleaned and trimmed
-            # data point
-            new_point = {}
-            ## TODO: use the helper functions to get the cleaned data from  ##
-            ## the original data dictionaries.                              ##
-            ## Note that the keys for the new_point dictionary should match ##
-            ## the column names set in the DictWriter object above.         ##
-            new_point['duration'] = duration_in_mins(row,city)
-            new_point['month'] = time_of_trip(row,city)
-            new_point['week'] = time_of_trip(row,city)
-            new_point['day_of_week'] = time_of_trip(row,city)
-            new_point['user_type'] = type_of_user(row,city)
-
-            ## TODO: write the processed information to the output file.     ##
-            
-            f_out.write("{},".format(new_point['duration']))
-            f_out.write("{},".format(new_point['month'][0]))
-            f_out.write("{},".format(new_point['week'][1]))
-            f_out.write("{},".format(new_point['day_of_week'][2]))
-            f_out.write("{}\n".format(new_point['user_type']))
+        write_condensed_header(f_out)
+
+        # stream rows straight from the reader, flushing output in batches #
+        trip_reader = csv.reader(f_in)
+        read_batch = compile_batch_reader(
+            city, next(trip_reader), None if station_tally is None else station_tally['station_codes'])
+        profiling = active_profile is not None
+        write_seconds = 0.0
+        for batch in trip_batches(trip_reader, read_batch, batch_size):
+            if profiling:
+                # split the output writes out of the parse/extract time #
+                t_write = time.perf_counter()
+                f_out.writelines(batch.lines())
+                write_seconds += time.perf_counter() - t_write
+            else:
+                f_out.writelines(batch.lines())
+            if station_tally is not None:
+                station_tally_add(station_tally, batch)
+            if trip_columns is not None:
+                trip_columns_add(trip_columns, batch)
+            n_rows += len(batch)
+    record_io('condense_data', rows=n_rows, bytes_read=os.path.getsize(in_file),
+              bytes_written=os.path.getsize(out_file))
+    record_io('condense_data: output writes', calls=1, seconds=write_seconds)
+    if trip_columns is not None:
+        write_trip_sidecar(out_file, *trip_records_from_columns(trip_columns))
+    if station_tally is not None:
+        write_station_index(out_file, station_index_from_tally(station_tally))
+
+    return condense_stats(city, n_rows, start, report)
+
+
+
+# input and output files of each city, as used by condense_parallel() #
+city_info = {'Washington': {'in_file': './data/Washington-CapitalBikeshare-2016.csv',
+                            'out_file': './data/Washington-2016-Summary.csv'},
+             'Chicago': {'in_file': './data/Chicago-Divvy-2016.csv',
+                         'out_file': './data/Chicago-2016-Summary.csv'},
+             'NYC': {'in_file': './data/NYC-CitiBike-2016.csv',
+                     'out_file': './data/NYC-2016-Summary.csv'}}
+
+
+def chunk_ranges(in_file, chunk_bytes):
+    """
+    Splits the body of a csv file into byte ranges of roughly chunk_bytes,
+    each starting and ending on a line boundary. Returns the header line and
+    a list of (start, end) offsets. Assumes no quoted field spans a newline,
+    which holds for all three city files.
+    """
+    size = os.path.getsize(in_file)
+    ranges = []
+    with open(in_file, 'rb') as f_in:
+        header = f_in.readline()
+        start = f_in.tell()
+        while start < size:
+            f_in.seek(min(start + chunk_bytes, size))
+            # move forward to the start of the next line #
+            f_in.readline()
+            end = f_in.tell()
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+ChunkStats = namedtuple('ChunkStats', ['city', 'chunk', 'start', 'end', 'rows', 'seconds'])
+
+
+def condense_chunk(in_file, header, start, end, city, part_file, chunk=0, batch_size=10000):
+    """
+    Condenses the rows between byte offsets start and end of in_file into
+    part_file, without a header row. Runs inside a worker process of
+    condense_parallel() and returns a ChunkStats tuple.
+    """
+    t0 = time.perf_counter()
+    encoding = locale.getpreferredencoding(False)
+    with open(in_file, 'rb') as f_in:
+        f_in.seek(start)
+        text = f_in.read(end - start).decode(encoding)
+    read_batch = compile_batch_reader(city, next(csv.reader([header.decode(encoding)])))
+
+    n_rows = 0
+    with open(part_file, 'w') as f_out:
+        trip_reader = csv.reader(io.StringIO(text))
+        for batch in trip_batches(trip_reader, read_batch, batch_size):
+            f_out.writelines(batch.lines())
+            n_rows += len(batch)
+    return ChunkStats(city, chunk, start, end, n_rows, time.perf_counter() - t0)
+
+
+@instrumented
+def condense_parallel(city_info, workers=None, chunk_bytes=64 * 2**20, report=False):
+    """
+    Condenses every city in city_info ({city: {'in_file': ..., 'out_file': ...}})
+    on a process pool. Each input file is split into byte-range chunks of
+    about chunk_bytes, so one large city also spreads across workers; the
+    chunks are merged back in file order, giving the same output as
+    condense_data(). workers defaults to the number of CPUs. The part files
+    are always removed, and an output file is only replaced once it has
+    been merged completely.
+
+    Returns the list of ChunkStats in (city, chunk) order; report=True also
+    prints the time taken by each chunk.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    tasks = []
+    parts = {}
+    for city, files in city_info.items():
+        header, ranges = chunk_ranges(files['in_file'], chunk_bytes)
+        parts[city] = []
+        for i, (start, end) in enumerate(ranges):
+            part_file = '{}.part{:05d}'.format(files['out_file'], i)
+            parts[city].append(part_file)
+            tasks.append((files['in_file'], header, start, end, city, part_file, i))
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(condense_chunk, *task) for task in tasks]
+            results = [future.result() for future in futures]
+
+        # stitch the parts back together in order behind a single header, #
+        # into a temporary file so a failed run never leaves half a summary #
+        for city, files in city_info.items():
+            with open(files['out_file'] + '.tmp', 'w') as f_out:
+                write_condensed_header(f_out)
+                for part_file in parts[city]:
+                    with open(part_file, 'r') as f_part:
+                        shutil.copyfileobj(f_part, f_out)
+            os.replace(files['out_file'] + '.tmp', files['out_file'])
+    finally:
+        leftovers = [files['out_file'] + '.tmp' for files in city_info.values()]
+        for city_parts in parts.values():
+            leftovers.extend(city_parts)
+        for path in leftovers:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    if report:
+        for stats in results:
+            print('{} chunk {}: {} rows in {:.2f}s'
+                  .format(stats.city, stats.chunk, stats.rows, stats.seconds))
+    return results
+
+
+def condensed_frame(chunk, schema):
+    """
+    Turns a dataframe chunk of raw trips into the condensed columns with
+    vectorized operations: duration unit conversion, datetime parsing and
+    the user type mapping declared in the city's schema.
+    """
+    import pandas as pd
+    start = pd.to_datetime(chunk[schema['start_time']], format=schema['time_format'])
+    user_type = chunk[schema['user_type']]
+    if schema['other_user_type'] is None:
+        if schema['user_types']:
+            user_type = user_type.replace(schema['user_types'])
+    else:
+        user_type = user_type.map(schema['user_types']).fillna(schema['other_user_type'])
+    return pd.DataFrame({
+        'duration': chunk[schema['duration']] / duration_divisors[schema['duration_unit']],
+        'month': start.dt.month.astype('uint8'),
+        'hour': start.dt.hour.astype('uint8'),
+        'day_of_week': start.dt.day_name(),
+        'user_type': user_type})
+
+
+@instrumented
+def condense_data_pandas(in_file, out_file, city, chunksize=2**19, output_format='csv', report=False):
+    """
+    Dataframe backend of condense_data(). The raw file is read chunksize
+    rows at a time, only the three needed columns and with explicit
+    dtypes, and each chunk is condensed with vectorized operations.
+
+    output_format='csv' writes the same bytes as condense_data();
+    output_format='parquet' writes the same columns to a Parquet file
+    (requires pyarrow). Returns a CondenseStats tuple like condense_data().
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+    schema = city_schema(city)
+    reader = pd.read_csv(in_file, chunksize=chunksize,
+                         usecols=[schema['duration'], schema['start_time'], schema['user_type']],
+                         dtype={schema['duration']: 'int64', schema['start_time']: str,
+                                schema['user_type']: str},
+                         keep_default_na=False)
+
+    n_rows = 0
+    if output_format == 'csv':
+        with open(out_file, 'w') as f_out:
+            write_condensed_header(f_out)
+            for chunk in reader:
+                condensed_frame(chunk, schema).to_csv(f_out, header=False, index=False,
+                                                      lineterminator='\n')
+                n_rows += len(chunk)
+    elif output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in reader:
+                table = pa.Table.from_pandas(condensed_frame(chunk, schema), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out_file, table.schema)
+                writer.write_table(table)
+                n_rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError("output_format must be 'csv' or 'parquet', not {!r}".format(output_format))
+
+    return condense_stats(city, n_rows, start, report)
+
+
+
+# on-disk cache of analysis results; set result_cache_dir to None to disable #
+result_cache_dir = '.bikeshare_cache'
+result_cache_max_bytes = 64 * 2**20
+# bump whenever a cached function or a helper it calls changes its result #
+result_cache_version = 1
+
+# bytes hashed from each end of a file for its fingerprint #
+fingerprint_sample_bytes = 64 * 2**10
+
+
+def file_fingerprint(filename):
+    """
+    Returns a fast content fingerprint of a file: its size and mtime plus a
+    hash of its first and last fingerprint_sample_bytes, so even a large
+    summary file is identified without reading it through.
+    """
+    source = os.stat(filename)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as f_in:
+        digest.update(f_in.read(fingerprint_sample_bytes))
+        if source.st_size > 2 * fingerprint_sample_bytes:
+            f_in.seek(-fingerprint_sample_bytes, os.SEEK_END)
+            digest.update(f_in.read())
+    return (source.st_size, source.st_mtime_ns, digest.hexdigest())
+
+
+def evict_result_cache(cache_dir, max_bytes):
+    """
+    Deletes the least recently used entries of the result cache until its
+    total size is at most max_bytes. Cache hits refresh an entry's mtime,
+    so the oldest mtime is the least recently used entry.
+    """
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def code_hash(code):
+    """
+    Returns a short hash of a code object: its bytecode and its constants,
+    hashing nested code objects (inner functions, comprehensions) the same
+    way, so a changed literal or inner function changes the hash too.
+    """
+    digest = hashlib.blake2b(code.co_code, digest_size=8)
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            digest.update(code_hash(const).encode())
+        else:
+            digest.update(repr(const).encode())
+    return digest.hexdigest()
+
+
+def cached_result(func):
+    """
+    Decorator for analysis functions whose first argument is a data file.
+    Results are pickled into result_cache_dir, keyed on the function name,
+    the remaining arguments and file_fingerprint() of the file, so reruns on
+    an unchanged file skip the csv entirely. The cache is capped at
+    result_cache_max_bytes with least recently used eviction. The original
+    function stays available as func.__wrapped__.
+
+    The key also holds result_cache_version and code_hash() of the
+    function, so editing the function's own body (its bytecode, literals or
+    inner functions) never returns pickles of the old version. Changes
+    inside helpers it calls are not seen and need a result_cache_version
+    bump.
+    """
+    func_hash = code_hash(func.__code__)
+
+    @wraps(func)
+    def wrapper(filename, *args, **kwargs):
+        cache_dir = result_cache_dir
+        if cache_dir is None:
+            return func(filename, *args, **kwargs)
+
+        key_data = (result_cache_version, func.__qualname__, func_hash,
+                    file_fingerprint(filename), args, sorted(kwargs.items()))
+        key = hashlib.blake2b(repr(key_data).encode(), digest_size=20).hexdigest()
+        path = os.path.join(cache_dir, '{}-{}.pkl'.format(func.__name__, key))
+        try:
+            with open(path, 'rb') as f_in:
+                result = pickle.load(f_in)
+            os.utime(path)
+            record_io(func.__name__, cache_hits=1)
+            return result
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            pass
+
+        result = func(filename, *args, **kwargs)
+        tmp_path = None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # a private temporary file, so concurrent writers never interleave #
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f_out:
+                pickle.dump(result, f_out, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            tmp_path = None
+            evict_result_cache(cache_dir, result_cache_max_bytes)
+        except (OSError, pickle.PicklingError, AttributeError, TypeError):
+            # an unwritable cache or unpicklable result only costs the speed-up #
+            pass
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        return result
+    return wrapper
 
 
 
@@ -208,6 +941,8 @@ def condense_data(in_file, out_file, city):
 
 
 
+@instrumented
+@cached_result
 def number_of_trips(filename):
     """
     This function reads in a file with trip data and reports the number of
@@ -239,35 +974,402 @@ def number_of_trips(filename):
         
         avg_subs_ride = len_subs_ride/n_subscribers
         avg_cust_ride = len_cust_ride/n_customers
+        record_io('number_of_trips', rows=n_total, bytes_read=os.path.getsize(filename))
         
         # return tallies as a tuple
         return(n_subscribers, n_customers, n_total, pct_subs, pct_custs, avg_subs_ride, avg_cust_ride)
 
 
 
-data_file1 = './data/Washington-2016-Summary.csv'
-data_file2 = './data/NYC-2016-Summary.csv'
-data_file3 = './data/Chicago-2016-Summary.csv'
+# month -> season lookup shared by the aggregation engine #
+season_of_month = {9: 'Fall', 10: 'Fall', 11: 'Fall',
+                   12: 'Winter', 1: 'Winter', 2: 'Winter',
+                   3: 'Spring', 4: 'Spring', 5: 'Spring',
+                   6: 'Summer', 7: 'Summer', 8: 'Summer'}
+season_names = ['Fall', 'Winter', 'Spring', 'Summer']
 
-list_n_trips = {"Washington":number_of_trips(data_file1)[2],
-                "NYC":number_of_trips(data_file2)[2], "Chicago": number_of_trips(data_file3)[2]}
-max_n_trips = max(list_n_trips, key=list_n_trips.get)                
-print('{} has the maximum number of trips, the number is {}' .format(max_n_trips, list_n_trips[max_n_trips]))
+# first seven fields line up with the number_of_trips() tuple, so
+# summary[5] / summary[6] keep working in the report code
+TripSummary = namedtuple('TripSummary', [
+    'n_subscribers', 'n_customers', 'n_total', 'pct_subs', 'pct_custs',
+    'avg_subs_ride', 'avg_cust_ride',
+    'len_total', 'n_short', 'n_long', 'avg_len', 'pct_long', 'pct_short',
+    'subs_season', 'cust_season', 'ratio_season', 'total_season',
+    'duration_sketches'])
 
-list_subs_pct = {"Washington":number_of_trips(data_file1)[3],
-                "NYC":number_of_trips(data_file2)[3], "Chicago": number_of_trips(data_file3)[3]}
-max_subs_pct = max(list_subs_pct, key=list_subs_pct.get)                
-print('{} has the highest proportion of trips made by subscribers, the percentage is {:.2%}' 
-      .format(max_subs_pct, list_subs_pct[max_subs_pct]))
 
-list_cust_pct = {"Washington":number_of_trips(data_file1)[4],
-                "NYC":number_of_trips(data_file2)[4], "Chicago": number_of_trips(data_file3)[4]}
-max_cust_pct = max(list_cust_pct, key=list_cust_pct.get)                
-print('{} has the highest proportion of trips made by customers, the percentage is {:.2%}' 
-      .format(max_cust_pct, list_cust_pct[max_cust_pct]))
+def _ratio(num, den):
+    # empty buckets report 0 instead of raising ZeroDivisionError #
+    return num / den if den else 0
+
+
+# relative error bound of the duration quantile sketches #
+sketch_accuracy = 0.01
+
+
+def new_sketch(relative_accuracy=sketch_accuracy):
+    """
+    Returns an empty duration quantile sketch. Values are counted in
+    logarithmic buckets of ratio gamma, so any quantile is answered within
+    relative_accuracy of the true value while memory only grows with the
+    log of the duration range (a few hundred buckets for trip data).
+    Sketches with the same accuracy merge exactly with sketch_merge().
+    """
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    return {'relative_accuracy': relative_accuracy, 'gamma': gamma,
+            'count': 0, 'zeros': 0, 'bins': {}}
+
+
+def sketch_add(sketch, value):
+    """
+    Adds one value to a quantile sketch.
+    """
+    sketch['count'] += 1
+    if value <= 0:
+        sketch['zeros'] += 1
+    else:
+        key = ceil(log(value) / log(sketch['gamma']))
+        sketch['bins'][key] = sketch['bins'].get(key, 0) + 1
+
+
+def sketch_merge(a, b):
+    """
+    Returns a new sketch holding the values of both sketches.
+    """
+    if a['gamma'] != b['gamma']:
+        raise ValueError('cannot merge sketches with different accuracy')
+    merged = new_sketch(a['relative_accuracy'])
+    merged['count'] = a['count'] + b['count']
+    merged['zeros'] = a['zeros'] + b['zeros']
+    bins = merged['bins']
+    for key, n in list(a['bins'].items()) + list(b['bins'].items()):
+        bins[key] = bins.get(key, 0) + n
+    return merged
+
+
+def sketch_quantile(sketch, q):
+    """
+    Returns the q-quantile (0 <= q <= 1) of the values in a sketch, within
+    its relative accuracy, or None for an empty sketch.
+    """
+    if not sketch['count']:
+        return None
+    rank = q * (sketch['count'] - 1)
+    seen = sketch['zeros']
+    if seen > rank:
+        return 0
+    gamma = sketch['gamma']
+    for key in sorted(sketch['bins']):
+        seen += sketch['bins'][key]
+        if seen > rank:
+            # midpoint of the bucket (gamma**(key-1), gamma**key] #
+            return 2 * gamma ** key / (gamma + 1)
+    return 2 * gamma ** max(sketch['bins']) / (gamma + 1)
+
+
+def new_tally():
+    """
+    Returns an empty set of running counts and duration sums, the raw state
+    that tally_trips() accumulates into and summary_from_tally() reads.
+    """
+    return {'n_subs': 0, 'n_cust': 0, 'len_subs': 0, 'len_cust': 0,
+            'n_short': 0, 'n_long': 0, 'len_short': 0, 'len_long': 0,
+            'subs_season': dict.fromkeys(season_names, 0),
+            'cust_season': dict.fromkeys(season_names, 0),
+            'sketches': {'Subscriber': new_sketch(), 'Customer': new_sketch()}}
+
+
+def tally_trips(trips, tally=None):
+    """
+    Takes an iterable of (duration, month, user_type) tuples and adds them to
+    a running tally (a fresh one when none is given). Every statistic in the
+    report is derived from these sums, so each trip is only looked at once.
+    """
+    if tally is None:
+        tally = new_tally()
+    subs_season = tally['subs_season']
+    cust_season = tally['cust_season']
+    subs_sketch = tally['sketches']['Subscriber']
+    cust_sketch = tally['sketches']['Customer']
+    subs_bins = subs_sketch['bins']
+    cust_bins = cust_sketch['bins']
+    log_gamma = log(subs_sketch['gamma'])
+
+    # keep the counters in locals inside the loop; sketch_add() is inlined #
+    n_subs = n_cust = n_short = n_long = 0
+    len_subs = len_cust = len_short = len_long = 0
+    subs_zeros = cust_zeros = 0
+    for duration, month, user_type in trips:
+        if user_type == 'Subscriber':
+            n_subs += 1
+            len_subs += duration
+            subs_season[season_of_month[month]] += 1
+            if duration > 0:
+                key = ceil(log(duration) / log_gamma)
+                subs_bins[key] = subs_bins.get(key, 0) + 1
+            else:
+                subs_zeros += 1
+        else:
+            n_cust += 1
+            len_cust += duration
+            cust_season[season_of_month[month]] += 1
+            if duration > 0:
+                key = ceil(log(duration) / log_gamma)
+                cust_bins[key] = cust_bins.get(key, 0) + 1
+            else:
+                cust_zeros += 1
+        if duration <= 30:
+            n_short += 1
+            len_short += duration
+        else:
+            n_long += 1
+            len_long += duration
+
+    tally['n_subs'] += n_subs
+    tally['n_cust'] += n_cust
+    tally['len_subs'] += len_subs
+    tally['len_cust'] += len_cust
+    tally['n_short'] += n_short
+    tally['n_long'] += n_long
+    tally['len_short'] += len_short
+    tally['len_long'] += len_long
+    subs_sketch['count'] += n_subs
+    subs_sketch['zeros'] += subs_zeros
+    cust_sketch['count'] += n_cust
+    cust_sketch['zeros'] += cust_zeros
+    return tally
+
+
+def merge_tallies(a, b):
+    """
+    Returns a new tally combining two tallies, e.g. from separate chunks of
+    the same file; the quantile sketches merge along with the sums.
+    """
+    merged = new_tally()
+    for key in ('n_subs', 'n_cust', 'len_subs', 'len_cust',
+                'n_short', 'n_long', 'len_short', 'len_long'):
+        merged[key] = a[key] + b[key]
+    for key in ('subs_season', 'cust_season'):
+        merged[key] = {s: a[key][s] + b[key][s] for s in season_names}
+    merged['sketches'] = {user_type: sketch_merge(a['sketches'][user_type], b['sketches'][user_type])
+                          for user_type in ('Subscriber', 'Customer')}
+    return merged
+
+
+def summary_from_tally(tally):
+    """
+    Turns a running tally into a TripSummary holding the same numbers that
+    number_of_trips(), length_of_trips() and trip_month() report.
+    """
+    n_subs = tally['n_subs']
+    n_cust = tally['n_cust']
+    n_total = n_subs + n_cust
+    len_total = tally['len_short'] + tally['len_long']
+
+    subs_season = dict(tally['subs_season'])
+    cust_season = dict(tally['cust_season'])
+    ratio_season = {s: _ratio(subs_season[s], cust_season[s]) for s in season_names}
+    total_season = {s: subs_season[s] + cust_season[s] for s in season_names}
+
+    sketches = tally['sketches']
+    duration_sketches = {'Subscriber': sketches['Subscriber'],
+                         'Customer': sketches['Customer'],
+                         'All': sketch_merge(sketches['Subscriber'], sketches['Customer'])}
+
+    return TripSummary(n_subs, n_cust, n_total,
+                       _ratio(n_subs, n_total), _ratio(n_cust, n_total),
+                       _ratio(tally['len_subs'], n_subs), _ratio(tally['len_cust'], n_cust),
+                       len_total, tally['n_short'], tally['n_long'],
+                       _ratio(len_total, n_total),
+                       _ratio(tally['n_long'], n_total), _ratio(tally['n_short'], n_total),
+                       subs_season, cust_season, ratio_season, total_season,
+                       duration_sketches)
+
+
+def read_summary_trips(filename, stage=None):
+    """
+    Generator over a *-Summary.csv file yielding (duration, month, user_type)
+    tuples, looking the columns up once from the header row. The rows and
+    bytes read are added to the profile stage of the calling function, when
+    it passes its name as stage.
+    """
+    with open(filename, 'r') as f_in:
+        reader = csv.reader(f_in)
+        header = next(reader)
+        i_dur = header.index('duration')
+        i_month = header.index('month')
+        i_user = header.index('user_type')
+        n_rows = 0
+        # blank lines come back as [] and are skipped, as csv.DictReader does #
+        for row in filter(None, reader):
+            n_rows += 1
+            yield float(row[i_dur]), int(row[i_month]), row[i_user]
+    if stage is not None:
+        record_io(stage, rows=n_rows, bytes_read=os.path.getsize(filename))
+
+
+@instrumented
+@cached_result
+def trip_summary(filename):
+    """
+    This function reads a summary file once and returns a TripSummary with
+    the user type counts and percentages, the average durations, the
+    short/long split at 30 minutes and the seasonal tallies.
+    """
+    return summary_from_tally(tally_trips(read_summary_trips(filename, 'trip_summary')))
+
+
+def trip_quantile(summary, q, user_type='All'):
+    """
+    Returns the approximate q-quantile of trip duration (e.g. q=0.5 for the
+    median, 0.95 for p95) from a TripSummary, for 'Subscriber', 'Customer'
+    or 'All' trips. The error is bounded by sketch_accuracy.
+    """
+    return sketch_quantile(summary.duration_sketches[user_type], q)
+
+
+def tally_chunk(filename, start, end, columns):
+    """
+    Tallies the summary rows between byte offsets start and end of filename,
+    with columns giving the (duration, month, user_type) positions. Runs
+    inside a worker process of trip_summary_parallel().
+    """
+    i_dur, i_month, i_user = columns
+    with open(filename, 'rb') as f_in:
+        f_in.seek(start)
+        text = f_in.read(end - start).decode(locale.getpreferredencoding(False))
+    trips = ((float(row[i_dur]), int(row[i_month]), row[i_user])
+             for row in filter(None, csv.reader(io.StringIO(text))))
+    return tally_trips(trips)
+
+
+@instrumented
+def trip_summary_parallel(filename, workers=None, chunk_bytes=16 * 2**20):
+    """
+    Same result as trip_summary(), but the file is split into byte-range
+    chunks that are tallied on a process pool and merged, sketches included.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    header, ranges = chunk_ranges(filename, chunk_bytes)
+    header = next(csv.reader([header.decode(locale.getpreferredencoding(False))]))
+    columns = tuple(header.index(col) for col in ('duration', 'month', 'user_type'))
+
+    tally = new_tally()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(tally_chunk, filename, start, end, columns)
+                   for start, end in ranges]
+        # merge in file order so the result does not depend on scheduling #
+        for future in futures:
+            tally = merge_tallies(tally, future.result())
+    return summary_from_tally(tally)
+
 
-                
 
+def load_ingest_state(state_file):
+    """
+    Reads the state kept by ingest_incremental(): the byte offset reached in
+    every input file, the byte length of the summary file and the running
+    tally. Returns a fresh state when the file does not exist yet.
+    """
+    if not os.path.exists(state_file):
+        return {'files': {}, 'tally': new_tally()}
+    with open(state_file, 'r') as f_in:
+        state = json.load(f_in)
+    # json turns the integer sketch bucket keys into strings #
+    for sketch in state['tally']['sketches'].values():
+        sketch['bins'] = {int(key): n for key, n in sketch['bins'].items()}
+    return state
+
+
+def save_ingest_state(state, state_file):
+    """
+    Writes the ingest state atomically, so an interrupted run keeps the
+    previous state intact.
+    """
+    with open(state_file + '.tmp', 'w') as f_out:
+        json.dump(state, f_out)
+    os.replace(state_file + '.tmp', state_file)
+
+
+def _complete_lines(f_in, encoding, progress):
+    # yields decoded lines and advances progress['offset'] past each one;
+    # a trailing line without a newline is still being written and is left
+    # for the next run
+    for line in f_in:
+        if not line.endswith(b'\n'):
+            break
+        progress['offset'] += len(line)
+        yield line.decode(encoding)
+
+
+@instrumented
+def ingest_incremental(in_files, out_file, city, state_file, batch_size=10000):
+    """
+    Condenses only the rows of in_files that earlier runs have not seen and
+    appends them to out_file, adding them to the running tally stored in
+    state_file. New monthly or quarterly files are simply added to in_files;
+    files that grew are resumed from the stored byte offset.
+
+    Returns the TripSummary of everything ingested so far, computed from the
+    stored tally without rescanning out_file. Rows a failed run appended
+    after the last saved state are cut off out_file before resuming, so
+    they are not written twice. Without a state_file, out_file must not
+    exist yet (or be empty), since rows already in it could not be
+    accounted for; ValueError is raised otherwise.
+    """
+    fresh = not os.path.exists(state_file)
+    if fresh and os.path.exists(out_file) and os.path.getsize(out_file) > 0:
+        raise ValueError('{} already holds rows that {} does not account for; '
+                         'remove it to rebuild it from scratch'.format(out_file, state_file))
+    state = load_ingest_state(state_file)
+    tally = state['tally']
+    encoding = locale.getpreferredencoding(False)
+
+    # states written before out_size was tracked cannot be checked #
+    out_size = state.get('out_size')
+    if out_size is not None and os.path.exists(out_file) and os.path.getsize(out_file) > out_size:
+        os.truncate(out_file, out_size)
+
+    with open(out_file, 'a') as f_out:
+        if f_out.tell() == 0:
+            write_condensed_header(f_out)
+        if fresh:
+            # record the header, so a failed first run is rolled back too #
+            f_out.flush()
+            state['out_size'] = os.path.getsize(out_file)
+            save_ingest_state(state, state_file)
+
+        for in_file in in_files:
+            key = os.path.abspath(in_file)
+            seen = state['files'].get(key)
+            with open(in_file, 'rb') as f_in:
+                read_batch = compile_batch_reader(city, next(csv.reader([f_in.readline().decode(encoding)])))
+                progress = {'offset': f_in.tell()}
+                if seen is not None:
+                    if os.path.getsize(in_file) < seen['offset']:
+                        raise ValueError('{} is smaller than when it was last ingested; '
+                                         'rebuild {} from scratch'.format(in_file, out_file))
+                    progress['offset'] = seen['offset']
+                    f_in.seek(seen['offset'])
+
+                trip_reader = csv.reader(_complete_lines(f_in, encoding, progress))
+                for batch in trip_batches(trip_reader, read_batch, batch_size):
+                    f_out.writelines(batch.lines())
+                    tally_trips(batch.tally_rows(), tally)
+
+            # output must be on disk before the state says it was ingested #
+            f_out.flush()
+            state['files'][key] = {'offset': progress['offset']}
+            state['out_size'] = os.path.getsize(out_file)
+            save_ingest_state(state, state_file)
+
+    return summary_from_tally(tally)
+
+
+
+@instrumented
+@cached_result
 def length_of_trips(filename):
     
     with open(filename, 'r') as f_in:
@@ -295,68 +1397,15 @@ def length_of_trips(filename):
         avg_len = len_total/n_total
         pct_long = n_long/n_total
         pct_short = n_short/n_total
+        record_io('length_of_trips', rows=n_total, bytes_read=os.path.getsize(filename))
         
         return(len_total, n_total, avg_len, pct_long, pct_short)
     
-data_file1 = './data/Washington-2016-Summary.csv'
-data_file2 = './data/NYC-2016-Summary.csv'
-data_file3 = './data/Chicago-2016-Summary.csv'  
-
-list_len = {"Washingtion":length_of_trips(data_file1)[2],
-            "NYC":length_of_trips(data_file2)[2], "Chicago":length_of_trips(data_file3)[2]}
-print('The average trip length for {} is {:.2f} (min), the proportion of rides made are longer that 30 mins is {:.2%}'.
-      format(list(list_len.keys())[list(list_len.values()).index(length_of_trips(data_file1)[2])],
-             length_of_trips(data_file1)[2], length_of_trips(data_file1)[3]))
-print('The average trip length for {} is {:.2f} (min), the proportion of rides made are longer that 30 mins is {:.2%}'.
-      format(list(list_len.keys())[list(list_len.values()).index(length_of_trips(data_file2)[2])],
-             length_of_trips(data_file2)[2], length_of_trips(data_file2)[3]))
-print('The average trip length for {} is {:.2f} (min), the proportion of rides made are longer that 30 mins is {:.2%}'.
-      format(list(list_len.keys())[list(list_len.values()).index(length_of_trips(data_file3)[2])],
-             length_of_trips(data_file3)[2], length_of_trips(data_file3)[3]))
-
-
-
-
-data_file = './data/Washington-2016-Summary.csv'
-
-if number_of_trips(data_file)[5] > number_of_trips(data_file)[6]:
-    print ('Subscribers in Washington take longer rides on the average. The average subscriber trip duration is {:.2f}(mins),the average customer trip duration is {:.2f} (mins)'.format(number_of_trips(data_file)[5], number_of_trips(data_file)[6]))
-else:
-    print ('Customers in Washington take longer rides on the average. The average subscriber trip duration is {:.2f}(mins), the average customer trip duration is {:.2f}(mins)'.format(number_of_trips(data_file)[5], number_of_trips(data_file)[6]))
-
-
-
-
-
-
-# load library
-import matplotlib.pyplot as plt
-
-# this is a 'magic word' that allows for plots to be displayed
-# inline with the notebook. If you want to know more, see:
-# http://ipython.readthedocs.io/en/stable/interactive/magics.html
-get_ipython().run_line_magic('matplotlib', 'inline')
-
-# example histogram, data taken from bay area sample
-data = [ 7.65,  8.92,  7.42,  5.50, 16.17,  4.20,  8.98,  9.62, 11.48, 14.33,
-        19.02, 21.53,  3.90,  7.97,  2.62,  2.67,  3.08, 14.40, 12.90,  7.83,
-        25.12,  8.30,  4.93, 12.43, 10.60,  6.17, 10.88,  4.78, 15.15,  3.53,
-         9.43, 13.32, 11.72,  9.85,  5.22, 15.10,  3.95,  3.17,  8.78,  1.88,
-         4.55, 12.68, 12.38,  9.78,  7.63,  6.45, 17.38, 11.90, 11.52,  8.63,]
-plt.hist(data)
-plt.title('Distribution of Trip Durations')
-plt.xlabel('Duration (m)')
-plt.show()
-
-
-
-
-tripdata = []
-
 def list_triptimes (filename):
     """
     Function that reads trip data and reports the number of trips made
     """
+    tripdata = []
     with open(filename, 'r') as f_in:
         reader = csv.DictReader(f_in)
         
@@ -364,23 +1413,41 @@ def list_triptimes (filename):
         for row in reader:
             tripdata.append(float(row['duration']))
         return tripdata
-        
-data_file = './data/Washington-2016-Summary.csv'
-bins = [0,20,40,60,80,100,120,140,160,180,200,220,240,260,280]
 
-plt.hist(list_triptimes(data_file),bins)
-plt.title('Trip Duration - Washington')
-plt.xlabel('Duration (mins)')
-plt.legend ()
-plt.show()
-           
 
+@instrumented
+@cached_result
+def duration_histogram(filename, bins):
+    """
+    Bins the trip durations of a summary file on the fly into the given bin
+    edges and returns (edges, counts), where counts maps 'Subscriber',
+    'Customer' and 'All' to a list of per-bin counts. Only the counts are
+    kept, so memory is O(bins) and repeated calls never double-count.
 
+    Bins follow plt.hist: each bin is half-open except the last, which
+    includes its right edge, and durations outside the edges are dropped.
+    """
+    edges = list(bins)
+    n_bins = len(edges) - 1
+    last_edge = edges[-1]
+    subs_counts = [0] * n_bins
+    cust_counts = [0] * n_bins
+    for duration, month, user_type in read_summary_trips(filename, 'duration_histogram'):
+        i = bisect_right(edges, duration) - 1
+        if i == n_bins and duration == last_edge:
+            i -= 1
+        if 0 <= i < n_bins:
+            if user_type == 'Subscriber':
+                subs_counts[i] += 1
+            else:
+                cust_counts[i] += 1
+    all_counts = [a + b for a, b in zip(subs_counts, cust_counts)]
+    return edges, {'Subscriber': subs_counts, 'Customer': cust_counts, 'All': all_counts}
 
-subs_data = []
-cust_data = []
 
 def list_triptimes(filename):
+    subs_data = []
+    cust_data = []
     with open(filename, 'r') as f_in:
         reader = csv.DictReader(f_in)
         
@@ -392,27 +1459,8 @@ def list_triptimes(filename):
                 cust_data.append(float(row['duration']))
         return (subs_data, cust_data)
     
-data_file = './data/Washington-2016-Summary.csv'
-bins =[0,5,10,15,20,25,30,35,40,45,50,55,60,65,70,75]
-
-plt.hist(list_triptimes(data_file)[0],bins,histtype='bar',rwidth=0.8)
-plt.title('Subscriber Trip Duration - Washington')
-plt.xlabel('Duration (mins)')
-plt.legend ()
-plt.show()
-
-plt.hist(list_triptimes(data_file)[1],bins,histtype='bar',rwidth=0.8)
-plt.title('Customer Trip Duration - Washington')
-plt.xlabel('Duration (mins)')
-plt.legend ()
-plt.show()
-
-
-
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-
+@instrumented
+@cached_result
 def trip_month(filename):
     
     with open(filename, 'r') as f_in:
@@ -463,6 +1511,8 @@ def trip_month(filename):
         winter_total = cnt_subs_winter+cnt_cust_winter
         spring_total = cnt_subs_spring+cnt_cust_spring
         summer_total = cnt_subs_summer+cnt_cust_summer
+        record_io('trip_month', rows=fall_total + winter_total + spring_total + summer_total,
+                  bytes_read=os.path.getsize(filename))
         
         subs_season = {"Fall": cnt_subs_fall,"Winter": cnt_subs_winter,"Spring": cnt_subs_spring,"Summer": cnt_subs_summer}
         cust_season = {"Fall": cnt_cust_fall,"Winter": cnt_cust_winter,"Spring": cnt_cust_spring,"Summer": cnt_cust_summer}
@@ -471,50 +1521,1053 @@ def trip_month(filename):
         
         return subs_season,cust_season,ratio_season,total_season
     
-data_file1 = './data/Washington-2016-Summary.csv'
-data_file2 = './data/NYC-2016-Summary.csv'
-data_file3 = './data/Chicago-2016-Summary.csv' 
 
 
-subs_season1,cust_season1,ratio_season1,total_season1 = trip_month(data_file1) #Washington Season Data#
-max1 =max(total_season1, key=total_season1.get)
-max_subs1 = max(subs_season1, key=subs_season1.get)
-print("For Washington, highest ridership is during {}, {}. {} has the highest subscriber ridership at {}" .format(max1, total_season1[max1], max_subs1, subs_season1[max_subs1]))
+@lru_cache(maxsize=None)
+def trip_dtype():
+    """
+    Returns the numpy dtype of one 8 byte trip record: a float32 duration
+    plus four uint8 codes. numpy is only imported on first use.
+    """
+    import numpy as np
+    return np.dtype([('duration', '<f4'), ('month', 'u1'), ('hour', 'u1'),
+                     ('day_of_week', 'u1'), ('user_type', 'u1')])
+
+# user_type is stored as a code into TripTable.user_types; Subscriber is
+# always code 0 so every other label counts as a customer, as in
+# number_of_trips()
+default_user_types = ('Subscriber', 'Customer')
+
+TripTable = namedtuple('TripTable', ['duration', 'month', 'hour', 'day_of_week',
+                                     'user_type', 'user_types'])
+
+
+def table_from_records(trips, user_types):
+    """
+    Wraps a structured array of trip_dtype records in a TripTable whose
+    columns are views onto the array (no copies are made).
+    """
+    return TripTable(trips['duration'], trips['month'], trips['hour'],
+                     trips['day_of_week'], trips['user_type'], tuple(user_types))
+
+
+def new_trip_columns():
+    """
+    Returns empty typed column buffers collecting trips for
+    trip_records_from_columns(), at a few bytes per trip instead of a dict.
+    user_codes numbers the user type labels, default_user_types first.
+    """
+    return {'user_codes': {name: code for code, name in enumerate(default_user_types)},
+            'duration': array('f'), 'month': bytearray(), 'hour': bytearray(),
+            'day_of_week': bytearray(), 'user_type': bytearray()}
+
+
+def trip_columns_add(columns, batch):
+    """
+    Appends the trips of a TripBatch to trip columns, translating the
+    batch's own user type codes into the columns' user_codes.
+    """
+    user_codes = columns['user_codes']
+    translate = bytearray(256)
+    for code, name in enumerate(batch.user_types):
+        translate[code] = user_codes.setdefault(name, len(user_codes))
+    # the doubles are rounded to float32 as they are appended #
+    columns['duration'].fromlist(batch.durations.tolist())
+    columns['month'] += batch.months
+    columns['hour'] += batch.hours
+    columns['day_of_week'] += batch.days_of_week
+    columns['user_type'] += batch.user_codes.tobytes().translate(translate)
+
+
+def trip_records_from_columns(columns):
+    """
+    Returns the trip columns as a structured array of trip_dtype records,
+    along with the tuple of user type labels its codes refer to.
+    """
+    import numpy as np
+    trips = np.empty(len(columns['duration']), dtype=trip_dtype())
+    trips['duration'] = np.frombuffer(columns['duration'], dtype=np.float32)
+    for field in ('month', 'hour', 'day_of_week', 'user_type'):
+        trips[field] = np.frombuffer(columns[field], dtype=np.uint8)
+    return trips, tuple(columns['user_codes'])
+
+
+def read_trip_records(filename):
+    """
+    Reads a *-Summary.csv file into a structured array of trip_dtype records
+    and returns it with the tuple of user type labels its codes refer to.
+    """
+    columns = new_trip_columns()
+    user_codes = columns['user_codes']
+    duration, month, hour = columns['duration'], columns['month'], columns['hour']
+    day_of_week, user_type = columns['day_of_week'], columns['user_type']
+    with open(filename, 'r') as f_in:
+        reader = csv.reader(f_in)
+        header = next(reader)
+        i_dur, i_month, i_hour, i_day, i_user = (
+            header.index(col) for col in ('duration', 'month', 'hour', 'day_of_week', 'user_type'))
+        for row in filter(None, reader):
+            duration.append(float(row[i_dur]))
+            month.append(int(row[i_month]))
+            hour.append(int(row[i_hour]))
+            day_of_week.append(weekday_codes[row[i_day]])
+            user_type.append(user_codes.setdefault(row[i_user], len(user_codes)))
+    return trip_records_from_columns(columns)
+
+
+def sidecar_paths(filename):
+    """
+    Returns the (.npy, .json) paths of the binary sidecar of a summary file.
+    """
+    return filename + '.trips.npy', filename + '.trips.json'
+
+
+@instrumented
+def write_trip_sidecar(filename, trips=None, user_types=None):
+    """
+    Writes the trip records of a summary file to a memory-mappable .npy
+    sidecar, along with a small .json file holding the user type labels and
+    the size/mtime of the source it was built from. The records are read
+    from the csv when they are not passed in.
+    """
+    import numpy as np
+    if trips is None:
+        trips, user_types = read_trip_records(filename)
+    npy_path, meta_path = sidecar_paths(filename)
+    source = os.stat(filename)
+    meta = {'source_size': source.st_size, 'source_mtime_ns': source.st_mtime_ns,
+            'user_types': list(user_types)}
+
+    # write to temporary names first so a reader never sees half a sidecar #
+    with open(npy_path + '.tmp', 'wb') as f_out:
+        np.save(f_out, trips)
+    with open(meta_path + '.tmp', 'w') as f_out:
+        json.dump(meta, f_out)
+    os.replace(npy_path + '.tmp', npy_path)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def read_trip_sidecar(filename):
+    """
+    Returns (trips, user_types) from the sidecar of a summary file as a
+    read-only memory map, or (None, None) when the sidecar is missing or
+    the source file's size or mtime no longer match it.
+    """
+    import numpy as np
+    npy_path, meta_path = sidecar_paths(filename)
+    try:
+        with open(meta_path, 'r') as f_in:
+            meta = json.load(f_in)
+        source = os.stat(filename)
+        if (meta['source_size'] != source.st_size
+                or meta['source_mtime_ns'] != source.st_mtime_ns):
+            return None, None
+        trips = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None, None
+    if trips.dtype != trip_dtype():
+        return None, None
+    return trips, tuple(meta['user_types'])
+
+
+@instrumented
+def load_trip_table(filename, use_sidecar=True):
+    """
+    This function reads a summary file once into a columnar TripTable:
+    float32 durations, uint8 month/hour/weekday codes (weekday codes index
+    weekday_names) and a categorical user_type code.
+
+    With use_sidecar the table is memory-mapped from the binary sidecar when
+    it is up to date with the csv; otherwise the csv is parsed and the
+    sidecar rebuilt for next time.
+    """
+    if use_sidecar:
+        trips, user_types = read_trip_sidecar(filename)
+        if trips is not None:
+            return table_from_records(trips, user_types)
+
+    trips, user_types = read_trip_records(filename)
+    if use_sidecar:
+        try:
+            write_trip_sidecar(filename, trips, user_types)
+        except OSError:
+            # a read-only data folder just means no cache #
+            pass
+    return table_from_records(trips, user_types)
+
+
+def table_number_of_trips(table):
+    """
+    Vectorized number_of_trips() over a TripTable; returns the same tuple.
+    """
+    import numpy as np
+    is_subs = table.user_type == 0
+    n_total = len(is_subs)
+    n_subscribers = int(np.count_nonzero(is_subs))
+    n_customers = n_total - n_subscribers
+    durations = table.duration.astype(np.float64)
+    len_subs_ride = durations[is_subs].sum()
+    len_cust_ride = durations.sum() - len_subs_ride
+    return (n_subscribers, n_customers, n_total,
+            _ratio(n_subscribers, n_total), _ratio(n_customers, n_total),
+            _ratio(len_subs_ride, n_subscribers), _ratio(len_cust_ride, n_customers))
+
+
+def table_length_of_trips(table):
+    """
+    Vectorized length_of_trips() over a TripTable; returns the same tuple.
+    """
+    import numpy as np
+    durations = table.duration.astype(np.float64)
+    is_short = durations <= 30
+    n_total = len(durations)
+    n_short = int(np.count_nonzero(is_short))
+    n_long = n_total - n_short
+    len_total = durations.sum()
+    return (len_total, n_total, _ratio(len_total, n_total),
+            _ratio(n_long, n_total), _ratio(n_short, n_total))
+
+
+@lru_cache(maxsize=None)
+def season_index():
+    """
+    Returns an array giving the position in season_names of months 0..12
+    (0 is unused).
+    """
+    import numpy as np
+    return np.array([0] + [season_names.index(season_of_month[m]) for m in range(1, 13)],
+                    dtype=np.uint8)
+
+
+def table_trip_month(table):
+    """
+    Vectorized trip_month() over a TripTable; returns the same four dicts.
+    """
+    import numpy as np
+    seasons = season_index()[table.month]
+    is_subs = table.user_type == 0
+    subs_counts = np.bincount(seasons[is_subs], minlength=4)
+    cust_counts = np.bincount(seasons[~is_subs], minlength=4)
+
+    subs_season = {s: int(subs_counts[i]) for i, s in enumerate(season_names)}
+    cust_season = {s: int(cust_counts[i]) for i, s in enumerate(season_names)}
+    ratio_season = {s: _ratio(subs_season[s], cust_season[s]) for s in season_names}
+    total_season = {s: subs_season[s] + cust_season[s] for s in season_names}
+    return subs_season, cust_season, ratio_season, total_season
+
+
+def table_triptimes(table):
+    """
+    Returns the subscriber and customer durations of a TripTable as arrays,
+    the vectorized counterpart of list_triptimes().
+    """
+    is_subs = table.user_type == 0
+    return table.duration[is_subs], table.duration[~is_subs]
+
+
+
+# month x hour x weekday x user_type; user_type 0 is Subscriber, 1 Customer #
+cube_axes = ('month', 'hour', 'day_of_week', 'user_type')
+cube_shape = (12, 24, 7, 2)
+
+TripCube = namedtuple('TripCube', ['counts', 'durations'])
+
+
+def build_trip_cube(table):
+    """
+    Precomputes the trip count and duration sum of every month x hour x
+    weekday x user_type cell (12*24*7*2 cells) of a TripTable in one
+    vectorized pass. Any user type other than Subscriber counts as Customer.
+    """
+    import numpy as np
+    user = np.minimum(table.user_type, 1)
+    cell = ((((table.month.astype(np.intp) - 1) * 24 + table.hour) * 7
+             + table.day_of_week) * 2 + user)
+    n_cells = 12 * 24 * 7 * 2
+    counts = np.bincount(cell, minlength=n_cells).reshape(cube_shape)
+    durations = np.bincount(cell, weights=table.duration.astype(np.float64),
+                            minlength=n_cells).reshape(cube_shape)
+    return TripCube(counts, durations)
+
+
+@instrumented
+@cached_result
+def load_trip_cube(filename):
+    """
+    Returns the TripCube of a summary file, built from its TripTable. The
+    cube is a few hundred kilobytes and is kept in the result cache.
+    """
+    return build_trip_cube(load_trip_table(filename))
+
+
+def _cube_index(axis, value):
+    # turns a selector value into the cell positions along one axis #
+    if value is None:
+        return list(range(cube_shape[cube_axes.index(axis)]))
+    if isinstance(value, (str, int)):
+        value = [value]
+    if axis == 'month':
+        return [m - 1 for m in value]
+    if axis == 'day_of_week':
+        return [weekday_names.index(d) if isinstance(d, str) else d for d in value]
+    if axis == 'user_type':
+        return [0 if u in ('Subscriber', 0) else 1 for u in value]
+    return list(value)
 
-subs_season2,cust_season2,ratio_season2,total_season2 = trip_month(data_file2) #NYC Season Data#
-max2 =max(total_season2, key=total_season2.get)
-max_subs2 = max(subs_season2, key=subs_season2.get)
-print("For NYC, highest ridership is during {}, {}. {} has the highest subscriber ridership at {}" .format(max2, total_season2[max2], max_subs2, subs_season2[max_subs2]))
 
-subs_season3,cust_season3,ratio_season3,total_season3 = trip_month(data_file3) #Chicago Season Data#
-max3 =max(total_season3, key=total_season3.get)
-max_subs3 = max(subs_season3, key=subs_season3.get)
-print("For Chicago, highest ridership is during {}, {}. {} has the highest subscriber ridership at {}" .format(max3, total_season3[max3], max_subs3, subs_season3[max_subs3]))
+def _cube_select(cube, month=None, hour=None, day_of_week=None, user_type=None):
+    import numpy as np
+    index = np.ix_(_cube_index('month', month), _cube_index('hour', hour),
+                   _cube_index('day_of_week', day_of_week), _cube_index('user_type', user_type))
+    return cube.counts[index], cube.durations[index]
 
-#Bar Chart for Customer and Subscriber ridership#
 
-x = [k for k in subs_season3]
-y = [v for v in subs_season3.values()]
-x_pos = np.arange(len(x))
+def cube_rollup(cube, month=None, hour=None, day_of_week=None, user_type=None):
+    """
+    Returns (count, duration_sum, avg_duration) over the selected cells of
+    a TripCube. Each selector is None for all values, a single value or a
+    list: months 1-12, hours 0-23, weekday names or codes, and
+    'Subscriber'/'Customer'. For example cube_rollup(cube, month=[6, 7, 8])
+    covers the summer.
+    """
+    counts, durations = _cube_select(cube, month, hour, day_of_week, user_type)
+    count = int(counts.sum())
+    duration = float(durations.sum())
+    return count, duration, _ratio(duration, count)
 
-x2 = [k for k in subs_season3]
-y2 = [v for v in subs_season3.values()]
-x2_pos = np.arange(len(x2))
 
+def cube_group(cube, axis, month=None, hour=None, day_of_week=None, user_type=None):
+    """
+    Returns the trip counts along one axis ('month', 'hour', 'day_of_week'
+    or 'user_type') over the selected cells, e.g. trips per hour of the day
+    for subscribers with cube_group(cube, 'hour', user_type='Subscriber').
+    """
+    counts, _ = _cube_select(cube, month, hour, day_of_week, user_type)
+    keep = cube_axes.index(axis)
+    return counts.sum(axis=tuple(i for i in range(4) if i != keep))
+
+
+def cube_trip_month(cube):
+    """
+    Seasonal roll-up of a TripCube; returns the same four dicts as
+    trip_month().
+    """
+    subs_season = {s: 0 for s in season_names}
+    cust_season = {s: 0 for s in season_names}
+    by_month = cube.counts.sum(axis=(1, 2))
+    for m in range(1, 13):
+        season = season_of_month[m]
+        subs_season[season] += int(by_month[m - 1, 0])
+        cust_season[season] += int(by_month[m - 1, 1])
+    ratio_season = {s: _ratio(subs_season[s], cust_season[s]) for s in season_names}
+    total_season = {s: subs_season[s] + cust_season[s] for s in season_names}
+    return subs_season, cust_season, ratio_season, total_season
+
+
+def cube_weekday_weekend(cube, user_type=None):
+    """
+    Returns the number of trips made on weekdays and on weekends.
+    """
+    by_day = cube_group(cube, 'day_of_week', user_type=user_type)
+    return {'Weekday': int(by_day[:5].sum()), 'Weekend': int(by_day[5:].sum())}
+
+
+def cube_peak_hours(cube, n=3, **selectors):
+    """
+    Returns the n busiest hours of the day as (hour, trips) pairs, busiest
+    first, over the selected cells.
+    """
+    by_hour = cube_group(cube, 'hour', **selectors)
+    hours = sorted(range(24), key=lambda h: (-by_hour[h], h))[:n]
+    return [(h, int(by_hour[h])) for h in hours]
+
+
+def cube_user_ratio(cube, **selectors):
+    """
+    Returns the subscriber to customer trip ratio over the selected cells.
+    """
+    by_user = cube_group(cube, 'user_type', **selectors)
+    return _ratio(int(by_user[0]), int(by_user[1]))
+
+
+# ## Stations and routes
+# 
+# The summary files drop the stations, so condense_data(..., stations=True)
+# builds a station and route index on the side while it streams the raw
+# file. Station ids are interned to small integer codes; every station and
+# every (origin, destination) route seen gets a row of trip counts and
+# duration sums by time bucket, the start hour of the trip.
+
+# time buckets of the station index: the hour of day the trip started #
+station_buckets = 24
+
+StationIndex = namedtuple('StationIndex', ['stations', 'departures', 'departure_minutes',
+                                           'arrivals', 'arrival_minutes', 'routes',
+                                           'route_counts', 'route_minutes'])
+
+
+def new_station_tally():
+    """
+    Returns an empty station tally for station_tally_add(). Counts are kept
+    in uint32 and duration sums in float64 arrays of station_buckets
+    columns, grown as new stations and routes show up.
+    """
+    import numpy as np
+
+    def grid(dtype):
+        return np.zeros((0, station_buckets), dtype=dtype)
+    return {'station_codes': {}, 'route_codes': {},
+            'departures': grid(np.uint32), 'departure_minutes': grid(np.float64),
+            'arrivals': grid(np.uint32), 'arrival_minutes': grid(np.float64),
+            'route_counts': grid(np.uint32), 'route_minutes': grid(np.float64)}
+
+
+def _grow_rows(tally, names, n_rows):
+    # double the capacity so growing stays amortized O(1) per row #
+    import numpy as np
+    for name in names:
+        grid = tally[name]
+        if len(grid) < n_rows:
+            grown = np.zeros((max(n_rows, 2 * len(grid)), station_buckets), dtype=grid.dtype)
+            grown[:len(grid)] = grid
+            tally[name] = grown
+
+
+def _add_to_grid(counts, minutes, rows, buckets, durations):
+    # rows may repeat within a batch, so sum per distinct cell first #
+    import numpy as np
+    cells, inverse = np.unique(rows * station_buckets + buckets, return_inverse=True)
+    counts.reshape(-1)[cells] += np.bincount(inverse).astype(counts.dtype)
+    minutes.reshape(-1)[cells] += np.bincount(inverse, weights=durations)
+
+
+def station_tally_add(tally, batch):
+    """
+    Adds the trips of a TripBatch read with the tally's station_codes to a
+    station tally, one vectorized update per batch.
+    """
+    import numpy as np
+    if not len(batch):
+        return
+    origins = np.frombuffer(batch.origins, dtype=batch.origins.typecode).astype(np.int64)
+    destinations = np.frombuffer(batch.destinations, dtype=batch.destinations.typecode).astype(np.int64)
+    hours = np.frombuffer(batch.hours, dtype=np.uint8).astype(np.int64)
+    durations = np.frombuffer(batch.durations, dtype=np.float64)
+
+    # routes get codes in order of first appearance, like the stations #
+    route_codes = tally['route_codes']
+    keys, inverse = np.unique((origins << 32) | destinations, return_inverse=True)
+    codes = np.empty(len(keys), dtype=np.int64)
+    for i, key in enumerate(keys.tolist()):
+        code = route_codes.get(key)
+        if code is None:
+            code = route_codes[key] = len(route_codes)
+        codes[i] = code
+    routes = codes[inverse]
+
+    _grow_rows(tally, ('departures', 'departure_minutes', 'arrivals', 'arrival_minutes'),
+               len(tally['station_codes']))
+    _grow_rows(tally, ('route_counts', 'route_minutes'), len(route_codes))
+    _add_to_grid(tally['departures'], tally['departure_minutes'], origins, hours, durations)
+    _add_to_grid(tally['arrivals'], tally['arrival_minutes'], destinations, hours, durations)
+    _add_to_grid(tally['route_counts'], tally['route_minutes'], routes, hours, durations)
+
+
+def station_index_from_tally(tally):
+    """
+    Turns a station tally into a StationIndex: the station ids by code, the
+    (n_stations, station_buckets) departure and arrival grids, the
+    (n_routes, 2) origin/destination codes of the routes and their grids.
+    """
+    import numpy as np
+    n_stations = len(tally['station_codes'])
+    n_routes = len(tally['route_codes'])
+    routes = np.empty((n_routes, 2), dtype=np.uint32)
+    if n_routes:
+        keys = np.fromiter(tally['route_codes'], dtype=np.int64, count=n_routes)
+        rows = np.fromiter(tally['route_codes'].values(), dtype=np.int64, count=n_routes)
+        routes[rows, 0] = keys >> 32
+        routes[rows, 1] = keys & 0xffffffff
+    return StationIndex(tuple(tally['station_codes']),
+                        tally['departures'][:n_stations], tally['departure_minutes'][:n_stations],
+                        tally['arrivals'][:n_stations], tally['arrival_minutes'][:n_stations],
+                        routes, tally['route_counts'][:n_routes], tally['route_minutes'][:n_routes])
+
+
+def station_index_path(filename):
+    """
+    Returns the path of the station index written next to a summary file.
+    """
+    return filename + '.stations.npz'
+
+
+def write_station_index(filename, index):
+    """
+    Writes a StationIndex next to the summary file it was condensed with,
+    stamped with the size and mtime of that file.
+    """
+    import numpy as np
+    source = os.stat(filename)
+    path = station_index_path(filename)
+    with open(path + '.tmp', 'wb') as f_out:
+        np.savez(f_out, stations=np.array(index.stations, dtype=str),
+                 source=np.array([source.st_size, source.st_mtime_ns], dtype=np.int64),
+                 **{field: getattr(index, field) for field in StationIndex._fields[1:]})
+    os.replace(path + '.tmp', path)
+
+
+def load_station_index(filename):
+    """
+    Returns the StationIndex of a summary file, or None when it was not
+    condensed with stations=True or has been rewritten since.
+    """
+    import numpy as np
+    try:
+        with np.load(station_index_path(filename)) as data:
+            source = os.stat(filename)
+            if data['source'].tolist() != [source.st_size, source.st_mtime_ns]:
+                return None
+            return StationIndex(tuple(data['stations'].tolist()),
+                                *(data[field] for field in StationIndex._fields[1:]))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _bucket_totals(counts, minutes, hours):
+    # sum the selected hour buckets: None for all, an int or an iterable #
+    if hours is None:
+        return counts.sum(axis=1), minutes.sum(axis=1)
+    if isinstance(hours, int):
+        hours = [hours]
+    hours = list(hours)
+    return counts[:, hours].sum(axis=1), minutes[:, hours].sum(axis=1)
+
+
+def _top_rows(counts, n):
+    # indices of the n largest counts, largest first #
+    import numpy as np
+    counts = counts.astype(np.int64)
+    n = min(n, len(counts))
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-counts, n - 1)[:n]
+    return top[np.argsort(-counts[top], kind='stable')]
+
+
+def top_stations(index, n=10, hours=None, direction='departures'):
+    """
+    Returns the n busiest stations of a StationIndex as a list of
+    (station, trips, average minutes), for trips starting within hours (an
+    hour of day, an iterable of hours, or None for the whole day).
+    direction='arrivals' ranks by trips ending at the station instead.
+    """
+    if direction not in ('departures', 'arrivals'):
+        raise ValueError("direction must be 'departures' or 'arrivals'")
+    counts, minutes = _bucket_totals(getattr(index, direction),
+                                     getattr(index, direction[:-1] + '_minutes'), hours)
+    return [(index.stations[i], int(counts[i]), _ratio(float(minutes[i]), int(counts[i])))
+            for i in _top_rows(counts, n) if counts[i]]
+
+
+def top_routes(index, n=10, hours=None):
+    """
+    Returns the n busiest routes of a StationIndex as a list of
+    (origin, destination, trips, average minutes), for trips starting
+    within hours as in top_stations().
+    """
+    counts, minutes = _bucket_totals(index.route_counts, index.route_minutes, hours)
+    return [(index.stations[index.routes[i, 0]], index.stations[index.routes[i, 1]],
+             int(counts[i]), _ratio(float(minutes[i]), int(counts[i])))
+            for i in _top_rows(counts, n) if counts[i]]
+
+
+# ## Sampling
+# 
+# For quick approximate answers on production-size files, sample_data()
+# takes a seeded sample in a single streaming pass and writes it in the
+# condensed format. sample_estimates() scales the sample back up to the
+# full file, with confidence intervals. A reservoir sample is a simple
+# random sample, so the statistics functions can also be run on it
+# directly; a stratified one over-represents the small strata and must
+# only be read through sample_estimates().
+
+SampleEstimate = namedtuple('SampleEstimate', ['value', 'low', 'high', 'stderr'])
+
+
+def _open_unit(rng):
+    # uniform on the open interval (0, 1), safe to take the log of #
+    u = rng.random()
+    while u == 0.0:
+        u = rng.random()
+    return u
+
+
+def new_reservoir(size, rng):
+    """
+    Returns an empty reservoir keeping a uniform sample of size items from
+    a stream of unknown length, for reservoir_add().
+    """
+    return {'size': size, 'seen': 0, 'items': [], 'rng': rng, 'w': 1.0, 'next': size}
+
+
+def reservoir_add(reservoir, item):
+    """
+    Offers the next item of the stream to a reservoir. Uses Algorithm L:
+    after the reservoir fills up, the index of the next item to keep is
+    drawn directly, so the skipped items cost one comparison each.
+    """
+    seen = reservoir['seen']
+    reservoir['seen'] = seen + 1
+    size = reservoir['size']
+    if seen < size:
+        reservoir['items'].append(item)
+        if seen + 1 == size:
+            _reservoir_skip(reservoir, seen)
+    elif seen == reservoir['next']:
+        reservoir['items'][reservoir['rng'].randrange(size)] = item
+        _reservoir_skip(reservoir, seen)
+
+
+def reservoir_resize(reservoir, size):
+    """
+    Shrinks a reservoir to size items. The kept items are a uniform subset
+    of the current ones, so the reservoir stays a uniform sample of the
+    stream seen so far and reservoir_add() carries on from there.
+    """
+    rng = reservoir['rng']
+    if len(reservoir['items']) > size:
+        reservoir['items'] = rng.sample(reservoir['items'], size)
+    reservoir['size'] = size
+    seen = reservoir['seen']
+    if seen >= size:
+        # w is the size-th smallest of seen uniform keys, Beta(size, seen - size + 1) #
+        reservoir['w'] = min(rng.betavariate(size, seen - size + 1), 1 - 2**-53)
+        reservoir['next'] = seen + floor(log(_open_unit(rng)) / log(1 - reservoir['w']))
+
+
+def _reservoir_skip(reservoir, taken):
+    # draw the weight and the index of the next item to keep #
+    rng = reservoir['rng']
+    reservoir['w'] *= exp(log(_open_unit(rng)) / reservoir['size'])
+    reservoir['next'] = taken + 1 + floor(log(_open_unit(rng)) / log(1 - reservoir['w']))
+
+
+def reservoir_sample(iterable, size, rng):
+    """
+    Returns (items, n_seen): a uniform sample of size items of an iterable,
+    in one pass, and the number of items it had. The items between two
+    kept ones are skipped by islice without running any Python code.
+    """
+    reservoir = new_reservoir(size, rng)
+    counter = count()
+    # the counter only advances for items actually taken from iterable #
+    iterator = zip(iterable, counter)
+    for item in islice(iterator, size):
+        reservoir_add(reservoir, item[0])
+    while reservoir['seen'] >= size:
+        pair = next(islice(iterator, reservoir['next'] - reservoir['seen'], None), None)
+        if pair is None:
+            break
+        reservoir['seen'] = reservoir['next']
+        reservoir_add(reservoir, pair[0])
+    return reservoir['items'], next(counter)
+
+
+def sample_info_path(filename):
+    """
+    Returns the path of the sampling metadata written next to a sample file.
+    """
+    return filename + '.sample.json'
+
+
+@instrumented
+def sample_data(in_file, out_file, city, size, method='reservoir', seed=0, batch_size=10000):
+    """
+    Takes a reproducible random sample of the trips in a raw input file in
+    one streaming pass and writes it to out_file in the condensed format of
+    condense_data(), in input order. Memory holds only the sampled rows.
+
+    method='reservoir' keeps a uniform sample of size trips; only the kept
+    rows are parsed. method='stratified' splits size evenly over the
+    month x user_type strata found in the file (at least one trip each) and
+    keeps a uniform sample from every stratum, so rare strata such as
+    winter customers are still well covered. Because of that even split a
+    stratified sample is not representative of the file as a whole: read
+    it with sample_estimates(), not with the statistics functions.
+
+    The seed, the population of the file and of every stratum and the
+    sample sizes are written to a .sample.json file next to out_file for
+    sample_estimates(). Returns that metadata.
+    """
+    if size < 1:
+        raise ValueError('sample size must be at least 1')
+    rng = random.Random(seed)
+    strata = {}
+    with open(in_file, 'r') as f_in:
+        header = next(csv.reader([f_in.readline()]))
+        if method == 'reservoir':
+            # only lines are kept; skipped ones are never split into fields #
+            # blank lines are not trips, as in condense_data() #
+            kept, population = reservoir_sample(enumerate(filter(str.strip, f_in)), size, rng)
+            kept.sort()
+            read_batch = compile_batch_reader(city, header)
+            batch = read_batch(csv.reader(line for i, line in kept), len(kept))
+            strata['all'] = {'population': population, 'sample': len(batch)}
+            rows = batch.lines()
+        elif method == 'stratified':
+            reservoirs = {}
+            read_batch = compile_batch_reader(city, header)
+            i = 0
+            for batch in trip_batches(csv.reader(f_in), read_batch, batch_size):
+                user_types = batch.user_types
+                for trip in zip(batch.durations, batch.months, batch.hours,
+                                batch.days_of_week, map(user_types.__getitem__, batch.user_codes)):
+                    key = (trip[1], trip[4])
+                    reservoir = reservoirs.get(key)
+                    if reservoir is None:
+                        # a new stratum shrinks the share of all the others #
+                        per_stratum = max(1, size // (len(reservoirs) + 1))
+                        for other in reservoirs.values():
+                            reservoir_resize(other, per_stratum)
+                        reservoir = reservoirs[key] = new_reservoir(per_stratum, rng)
+                    reservoir_add(reservoir, (i, trip))
+                    i += 1
+            kept = sorted(item for reservoir in reservoirs.values() for item in reservoir['items'])
+            for (month, user_type), reservoir in sorted(reservoirs.items()):
+                strata['{}|{}'.format(month, user_type)] = {'population': reservoir['seen'],
+                                                            'sample': len(reservoir['items'])}
+            rows = ('{},{},{},{},{}\n'.format(duration, month, hour, weekday_names[day], user_type)
+                    for i, (duration, month, hour, day, user_type) in kept)
+        else:
+            raise ValueError("method must be 'reservoir' or 'stratified'")
+
+        with open(out_file, 'w') as f_out:
+            write_condensed_header(f_out)
+            f_out.writelines(rows)
+
+    info = {'city': city, 'source': os.path.abspath(in_file), 'method': method, 'seed': seed,
+            'population': sum(stratum['population'] for stratum in strata.values()),
+            'sample': sum(stratum['sample'] for stratum in strata.values()),
+            'strata': strata}
+    with open(sample_info_path(out_file), 'w') as f_out:
+        json.dump(info, f_out, indent=2)
+    record_io('sample_data', rows=info['population'], bytes_read=os.path.getsize(in_file),
+              bytes_written=os.path.getsize(out_file))
+    return info
+
+
+def _estimate_total(strata, value):
+    # stratified estimate of a population total and its variance, with the
+    # finite population correction; strata is a list of (population, rows) #
+    total = variance = 0.0
+    for population, rows in strata:
+        n = len(rows)
+        if not n:
+            continue
+        values = [value(row) for row in rows]
+        mean = sum(values) / n
+        total += population * mean
+        if n > 1:
+            s2 = sum((v - mean) ** 2 for v in values) / (n - 1)
+            variance += population ** 2 * (1 - n / population) * s2 / n
+    return total, variance
+
+
+def _estimate_ratio(strata, num, den):
+    # ratio of two totals, with the linearized (delta method) variance #
+    num_total = _estimate_total(strata, num)[0]
+    den_total = _estimate_total(strata, den)[0]
+    if not den_total:
+        return 0, 0.0
+    ratio = num_total / den_total
+    variance = _estimate_total(strata, lambda row: num(row) - ratio * den(row))[1]
+    return ratio, variance / den_total ** 2
+
+
+def sample_estimates(filename, confidence=0.95):
+    """
+    Estimates the statistics of the full file a sample_data() sample was
+    taken from. Returns a dict with the TripSummary fields (except the
+    duration sketches) mapped to SampleEstimate(value, low, high, stderr)
+    tuples, or to dicts of them by season. Intervals use the normal
+    approximation at the given confidence level; n_total is exact.
+    """
+    from statistics import NormalDist
+    try:
+        with open(sample_info_path(filename), 'r') as f_in:
+            info = json.load(f_in)
+    except OSError:
+        raise ValueError('{} has no sampling metadata; create it with sample_data()'
+                         .format(filename)) from None
+
+    # rows are (duration, month, user_type) as in read_summary_trips() #
+    rows = {}
+    for trip in read_summary_trips(filename):
+        key = 'all' if info['method'] == 'reservoir' else '{}|{}'.format(trip[1], trip[2])
+        rows.setdefault(key, []).append(trip)
+    strata = [(stratum['population'], rows.get(key, [])) for key, stratum in info['strata'].items()]
+    n_total = info['population']
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    def estimate(value_variance, scale=1):
+        value, variance = value_variance
+        stderr = sqrt(variance) / scale
+        value = value / scale
+        return SampleEstimate(value, value - z * stderr, value + z * stderr, stderr)
+
+    def is_subs(row):
+        return row[2] == 'Subscriber'
+
+    def is_cust(row):
+        return row[2] != 'Subscriber'
+
+    def is_long(row):
+        return row[0] > 30
+
+    def in_season(season, user=None):
+        return lambda row: season_of_month[row[1]] == season and (user is None or user(row))
+
+    estimates = {
+        'n_subscribers': estimate(_estimate_total(strata, is_subs)),
+        'n_customers': estimate(_estimate_total(strata, is_cust)),
+        'n_total': SampleEstimate(n_total, n_total, n_total, 0.0),
+        'pct_subs': estimate(_estimate_total(strata, is_subs), n_total),
+        'pct_custs': estimate(_estimate_total(strata, is_cust), n_total),
+        'avg_subs_ride': estimate(_estimate_ratio(strata, lambda row: row[0] * is_subs(row), is_subs)),
+        'avg_cust_ride': estimate(_estimate_ratio(strata, lambda row: row[0] * is_cust(row), is_cust)),
+        'len_total': estimate(_estimate_total(strata, lambda row: row[0])),
+        'n_short': estimate(_estimate_total(strata, lambda row: not is_long(row))),
+        'n_long': estimate(_estimate_total(strata, is_long)),
+        'avg_len': estimate(_estimate_total(strata, lambda row: row[0]), n_total),
+        'pct_long': estimate(_estimate_total(strata, is_long), n_total),
+        'pct_short': estimate(_estimate_total(strata, lambda row: not is_long(row)), n_total),
+        'subs_season': {s: estimate(_estimate_total(strata, in_season(s, is_subs)))
+                        for s in season_names},
+        'cust_season': {s: estimate(_estimate_total(strata, in_season(s, is_cust)))
+                        for s in season_names},
+        'ratio_season': {s: estimate(_estimate_ratio(strata, in_season(s, is_subs),
+                                                     in_season(s, is_cust)))
+                         for s in season_names},
+        'total_season': {s: estimate(_estimate_total(strata, in_season(s)))
+                         for s in season_names},
+    }
+    return estimates
+
+
+
+# ## Report
+# 
+# Everything below only runs when the script is executed directly (or main()
+# is called), so importing this module has no side effects: no data file is
+# opened and matplotlib is only loaded once a plot is drawn.
+
+# summary file of each city, as written by condense_data() #
+summary_files = {'Washington': './data/Washington-2016-Summary.csv',
+                 'NYC': './data/NYC-2016-Summary.csv',
+                 'Chicago': './data/Chicago-2016-Summary.csv'}
+
+
+@lru_cache(maxsize=None)
+def pyplot():
+    """
+    Imports matplotlib.pyplot on first use and returns it.
+    """
+    # load library
+    import matplotlib.pyplot as plt
+
+    # this is a 'magic word' that allows for plots to be displayed
+    # inline with the notebook. If you want to know more, see:
+    # http://ipython.readthedocs.io/en/stable/interactive/magics.html
+    try:
+        get_ipython().run_line_magic('matplotlib', 'inline')
+    except NameError:
+        # plain python, not a notebook #
+        pass
+    return plt
+
+
+def print_example_trips(data_files):
+    """
+    Prints the first trip from each file and returns them in a dictionary
+    keyed by city.
+    """
+    example_trips = {}
+    for data_file in data_files:
+        city, first_trip = print_first_point(data_file)
+        example_trips[city] = first_trip
+    return example_trips
+
+
+def print_trip_statistics(summaries):
+    """
+    Prints the trip count, user type and trip length comparisons between
+    cities from a dictionary of TripSummary results keyed by city.
+    """
+    list_n_trips = {city: summary.n_total for city, summary in summaries.items()}
+    max_n_trips = max(list_n_trips, key=list_n_trips.get)
+    print('{} has the maximum number of trips, the number is {}' .format(max_n_trips, list_n_trips[max_n_trips]))
+
+    list_subs_pct = {city: summary.pct_subs for city, summary in summaries.items()}
+    max_subs_pct = max(list_subs_pct, key=list_subs_pct.get)
+    print('{} has the highest proportion of trips made by subscribers, the percentage is {:.2%}'
+          .format(max_subs_pct, list_subs_pct[max_subs_pct]))
+
+    list_cust_pct = {city: summary.pct_custs for city, summary in summaries.items()}
+    max_cust_pct = max(list_cust_pct, key=list_cust_pct.get)
+    print('{} has the highest proportion of trips made by customers, the percentage is {:.2%}'
+          .format(max_cust_pct, list_cust_pct[max_cust_pct]))
+
+    for city in summaries:
+        print('The average trip length for {} is {:.2f} (min), the proportion of rides made are longer that 30 mins is {:.2%}'.
+              format(city, summaries[city].avg_len, summaries[city].pct_long))
+
+    wash_summary = summaries["Washington"]
+    if wash_summary.avg_subs_ride > wash_summary.avg_cust_ride:
+        print ('Subscribers in Washington take longer rides on the average. The average subscriber trip duration is {:.2f}(mins),the average customer trip duration is {:.2f} (mins)'.format(wash_summary.avg_subs_ride, wash_summary.avg_cust_ride))
+    else:
+        print ('Customers in Washington take longer rides on the average. The average subscriber trip duration is {:.2f}(mins), the average customer trip duration is {:.2f}(mins)'.format(wash_summary.avg_subs_ride, wash_summary.avg_cust_ride))
+
+
+def plot_example_histogram():
+    """
+    Plots the example histogram of the bay area sample durations.
+    """
+    plt = pyplot()
+
+    # example histogram, data taken from bay area sample
+    data = [ 7.65,  8.92,  7.42,  5.50, 16.17,  4.20,  8.98,  9.62, 11.48, 14.33,
+            19.02, 21.53,  3.90,  7.97,  2.62,  2.67,  3.08, 14.40, 12.90,  7.83,
+            25.12,  8.30,  4.93, 12.43, 10.60,  6.17, 10.88,  4.78, 15.15,  3.53,
+             9.43, 13.32, 11.72,  9.85,  5.22, 15.10,  3.95,  3.17,  8.78,  1.88,
+             4.55, 12.68, 12.38,  9.78,  7.63,  6.45, 17.38, 11.90, 11.52,  8.63,]
+    plt.hist(data)
+    plt.title('Distribution of Trip Durations')
+    plt.xlabel('Duration (m)')
+    plt.show()
+
+
+def plot_duration_histograms(data_file, city='Washington'):
+    """
+    Plots the trip duration histogram of a city, then the subscriber and
+    customer durations under 75 minutes.
+    """
+    plt = pyplot()
+
+    bins = [0,20,40,60,80,100,120,140,160,180,200,220,240,260,280]
+
+    # plot the pre-binned counts: one weighted sample per bin #
+    edges, counts = duration_histogram(data_file, bins)
+    plt.hist(edges[:-1], edges, weights=counts['All'])
+    plt.title('Trip Duration - {}'.format(city))
+    plt.xlabel('Duration (mins)')
+    plt.legend ()
+    plt.show()
+
+    bins =[0,5,10,15,20,25,30,35,40,45,50,55,60,65,70,75]
+
+    edges, counts = duration_histogram(data_file, bins)
+
+    plt.hist(edges[:-1],edges,weights=counts['Subscriber'],histtype='bar',rwidth=0.8)
+    plt.title('Subscriber Trip Duration - {}'.format(city))
+    plt.xlabel('Duration (mins)')
+    plt.legend ()
+    plt.show()
+
+    plt.hist(edges[:-1],edges,weights=counts['Customer'],histtype='bar',rwidth=0.8)
+    plt.title('Customer Trip Duration - {}'.format(city))
+    plt.xlabel('Duration (mins)')
+    plt.legend ()
+    plt.show()
+
+
+def print_seasonal_ridership(summaries):
+    """
+    Prints the season with the highest overall and subscriber ridership for
+    each city.
+    """
+    for city, summary in summaries.items():
+        subs_season, total_season = summary.subs_season, summary.total_season
+        max_total = max(total_season, key=total_season.get)
+        max_subs = max(subs_season, key=subs_season.get)
+        print("For {}, highest ridership is during {}, {}. {} has the highest subscriber ridership at {}"
+              .format(city, max_total, total_season[max_total], max_subs, subs_season[max_subs]))
+
+
+def plot_seasonal_ridership(summary):
+    """
+    Bar charts of subscriber and customer trips per season and of the
+    subscriber-customer ratio, for one city's TripSummary.
+    """
+    plt = pyplot()
+
+    #Bar Chart for Customer and Subscriber ridership#
+
+    x = [k for k in summary.subs_season]
+    y = [v for v in summary.subs_season.values()]
+
+    x2 = [k for k in summary.cust_season]
+    y2 = [v for v in summary.cust_season.values()]
+
+    plt.bar(x,y,alpha=0.5, label='Subscriber', color = 'y')
+    plt.bar(x2,y2, alpha=0.5, label='Customer', color = 'g')
+
+    plt.title('Customer and Subscriber Ridership Chart')
+    plt.xlabel('Seasons')
+    plt.ylabel('Trips')
+    plt.legend()
+    plt.show()
+
+    x3 = [k for k in summary.ratio_season]
+    y3 = [v for v in summary.ratio_season.values()]
+    plt.bar(x3,y3,alpha=0.5, label='Ratio' )
+    plt.title('Subscriber-Customer Trip Ratio')
+    plt.legend()
+    plt.show()
+
+
+def main(argv=None):
+    """
+    Command line entry point running run_report(). With --profile the run
+    is instrumented and its per-stage profile written as JSON and text.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description='Bike share trip analysis report')
+    parser.add_argument('--profile', metavar='JSON_FILE',
+                        help='write a per-stage profile of the run to JSON_FILE')
+    parser.add_argument('--cprofile', action='store_true',
+                        help='add the top cProfile functions to the profile')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='add tracemalloc peak and top allocations to the profile')
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        start_profile(cprofile=args.cprofile, memory=args.tracemalloc)
+        try:
+            run_report()
+        finally:
+            profile = stop_profile()
+            write_profile(profile, args.profile)
+            print(format_profile(profile))
+    else:
+        run_report()
+
+
+def run_report():
+    """
+    Runs the full report: example trips, trip statistics, duration
+    histograms and seasonal ridership.
+    """
+    print_example_trips(data_files)
 
-plt.bar(x,y,alpha=0.5, label='Subscriber', color = 'y')
-plt.bar(x2,y2, alpha=0.5, label='Customer', color = 'g')
+    # read each summary file once; every print below comes from these #
+    summaries = {city: trip_summary(filename) for city, filename in summary_files.items()}
 
-plt.title('Customer and Subscriber Ridership Chart')
-plt.xlabel('Seasons')
-plt.ylabel('Trips')
-plt.legend()
-plt.show()
+    print_trip_statistics(summaries)
+    plot_example_histogram()
+    plot_duration_histograms(summary_files['Washington'])
+    print_seasonal_ridership(summaries)
+    plot_seasonal_ridership(summaries['Chicago'])
 
-x3 = [k for k in ratio_season3]
-y3 = [v for v in ratio_season3.values()]
-plt.bar(x3,y3,alpha=0.5, label='Ratio' )
-plt.title('Subscriber-Customer Trip Ratio')
-plt.legend()
-plt.show()
 
+if __name__ == '__main__':
+    main()
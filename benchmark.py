@@ -0,0 +1,220 @@
+"""
+Benchmark harness for the bike share ingest and analytics hot paths.
+
+Generates synthetic raw trip files in each city's schema at multiples of
+the size of the 2% sample in ./data, then times the helper functions, the
+condensing stage and the summary statistics on them. Throughput and peak
+memory for every stage are written to a JSON results file so runs can be
+compared to catch regressions.
+
+    python benchmark.py --scales 1 10 100 --out bench_results.json
+"""
+
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from itertools import islice
+
+import Bike_Share_Project as bs
+
+# the dataframe backend is optional #
+pandas_available = importlib.util.find_spec('pandas') is not None
+
+
+# rows per city in the 2% sample files in ./data #
+sample_sizes = {'NYC': 276798, 'Chicago': 72131, 'Washington': 66326}
+
+# raw column layout of each city, matching the files in ./data #
+raw_columns = {
+    'NYC': ['tripduration', 'starttime', 'stoptime', 'start station id',
+            'start station name', 'start station latitude', 'start station longitude',
+            'end station id', 'end station name', 'end station latitude',
+            'end station longitude', 'bikeid', 'usertype', 'birth year', 'gender'],
+    'Chicago': ['trip_id', 'starttime', 'stoptime', 'bikeid', 'tripduration',
+                'from_station_id', 'from_station_name', 'to_station_id',
+                'to_station_name', 'usertype', 'gender', 'birthyear'],
+    'Washington': ['Duration (ms)', 'Start date', 'End date', 'Start station number',
+                   'Start station', 'End station number', 'End station',
+                   'Bike number', 'Member Type'],
+}
+
+# share of subscriber / registered trips, roughly as in the sample #
+subscriber_share = {'NYC': 0.89, 'Chicago': 0.76, 'Washington': 0.78}
+
+year_start = datetime(2016, 1, 1)
+seconds_in_year = 366 * 24 * 3600
+
+
+def _timestamp(moment, with_seconds):
+    # the raw files do not zero-pad month and day, e.g. 1/1/2016 00:09:55 #
+    stamp = '{}/{}/{} {:02d}:{:02d}'.format(moment.month, moment.day, moment.year,
+                                           moment.hour, moment.minute)
+    if with_seconds:
+        stamp += ':{:02d}'.format(moment.second)
+    return stamp
+
+
+def synthetic_rows(city, n_rows, seed=0):
+    """
+    Generator of n_rows raw trip rows (lists in raw_columns[city] order)
+    with a reproducible mix of durations, start times, stations and users.
+    """
+    rng = random.Random('{}-{}'.format(city, seed))
+    n_stations = 600
+    for i in range(n_rows):
+        seconds = int(rng.lognormvariate(6.6, 0.8)) + 60
+        start = year_start + timedelta(seconds=rng.randrange(seconds_in_year))
+        stop = start + timedelta(seconds=seconds)
+        subscriber = rng.random() < subscriber_share[city]
+        origin = rng.randrange(n_stations)
+        destination = rng.randrange(n_stations)
+        bike = rng.randrange(10000)
+
+        if city == 'NYC':
+            yield [seconds, _timestamp(start, True), _timestamp(stop, True),
+                   origin, 'Station {}'.format(origin), 40.7, -74.0,
+                   destination, 'Station {}'.format(destination), 40.7, -74.0,
+                   bike, 'Subscriber' if subscriber else 'Customer',
+                   1980 if subscriber else '', 1 if subscriber else 0]
+        elif city == 'Chicago':
+            yield [i, _timestamp(start, False), _timestamp(stop, False), bike, seconds,
+                   origin, 'Station {}'.format(origin),
+                   destination, 'Station {}'.format(destination),
+                   'Subscriber' if subscriber else 'Customer',
+                   'Male' if subscriber else '', 1980 if subscriber else '']
+        else:
+            yield [seconds * 1000 + rng.randrange(1000), _timestamp(start, False),
+                   _timestamp(stop, False), 31000 + origin, 'Station {}'.format(origin),
+                   31000 + destination, 'Station {}'.format(destination),
+                   'W{:05d}'.format(bike), 'Registered' if subscriber else 'Casual']
+
+
+def generate_data(workdir, scale, seed=0):
+    """
+    Writes raw files for every city at scale times the sample size into
+    workdir, reusing files generated earlier with the same scale and seed.
+    Returns a city_info style dict of input and output file names.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    city_info = {}
+    for city, sample_size in sample_sizes.items():
+        stem = os.path.join(workdir, '{}-x{}-s{}'.format(city, scale, seed))
+        in_file = stem + '-raw.csv'
+        if not os.path.exists(in_file):
+            with open(in_file + '.tmp', 'w', newline='') as f_out:
+                writer = csv.writer(f_out, lineterminator='\n')
+                writer.writerow(raw_columns[city])
+                writer.writerows(synthetic_rows(city, sample_size * scale, seed))
+            os.replace(in_file + '.tmp', in_file)
+        city_info[city] = {'in_file': in_file, 'out_file': stem + '-Summary.csv',
+                           'rows': sample_size * scale}
+    return city_info
+
+
+def measure(func, memory=True):
+    """
+    Runs func once for timing and, with memory=True, a second time under
+    tracemalloc for the peak Python heap usage. Returns (seconds, peak bytes).
+    """
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def run_benchmarks(scales, workdir, seed=0, row_limit=200000, memory=True):
+    """
+    Times every stage for every city at every scale and returns the list of
+    result records. The per-row helpers run over the first row_limit raw
+    rows so the rows themselves do not dominate memory at large scales.
+    """
+    # time the real work, not result cache hits #
+    bs.result_cache_dir = None
+    results = []
+
+    def record(stage, city, scale, rows, func):
+        seconds, peak = measure(func, memory)
+        results.append({'stage': stage, 'city': city, 'scale': scale, 'rows': rows,
+                        'seconds': seconds,
+                        'rows_per_sec': rows / seconds if seconds else None,
+                        'peak_memory_bytes': peak})
+        print('{:>20} {:>10} x{:<4} {:>10} rows {:8.3f}s'.format(stage, city, scale, rows, seconds))
+
+    for scale in scales:
+        city_info = generate_data(workdir, scale, seed)
+        for city, files in city_info.items():
+            with open(files['in_file'], 'r') as f_in:
+                rows = list(islice(csv.DictReader(f_in), row_limit))
+
+            record('duration_in_mins', city, scale, len(rows),
+                   lambda: [bs.duration_in_mins(row, city) for row in rows])
+            record('time_of_trip', city, scale, len(rows),
+                   lambda: [bs.time_of_trip(row, city) for row in rows])
+            record('type_of_user', city, scale, len(rows),
+                   lambda: [bs.type_of_user(row, city) for row in rows])
+            del rows
+
+            n_rows = files['rows']
+            record('condense_data', city, scale, n_rows,
+                   lambda: bs.condense_data(files['in_file'], files['out_file'], city))
+            if pandas_available:
+                record('condense_data_pandas', city, scale, n_rows,
+                       lambda: bs.condense_data_pandas(files['in_file'],
+                                                       files['out_file'] + '.pandas', city))
+            record('number_of_trips', city, scale, n_rows,
+                   lambda: bs.number_of_trips(files['out_file']))
+            record('length_of_trips', city, scale, n_rows,
+                   lambda: bs.length_of_trips(files['out_file']))
+            record('trip_month', city, scale, n_rows,
+                   lambda: bs.trip_month(files['out_file']))
+            record('trip_summary', city, scale, n_rows,
+                   lambda: bs.trip_summary(files['out_file']))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1],
+                        help='multiples of the sample size to generate, e.g. 1 10 100')
+    parser.add_argument('--workdir', default='bench_data',
+                        help='folder for the generated raw and summary files')
+    parser.add_argument('--out', default='bench_results.json',
+                        help='machine-readable results file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--row-limit', type=int, default=200000,
+                        help='rows used for the per-row helper benchmarks')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the tracemalloc peak memory runs')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scales, args.workdir, args.seed,
+                             args.row_limit, memory=not args.no_memory)
+    report = {'created': datetime.now().isoformat(timespec='seconds'),
+              'python': sys.version.split()[0],
+              'platform': platform.platform(),
+              'seed': args.seed,
+              'results': results}
+    with open(args.out, 'w') as f_out:
+        json.dump(report, f_out, indent=2)
+    print('results written to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main()
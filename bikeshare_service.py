@@ -0,0 +1,223 @@
+"""
+Small asyncio HTTP service serving the bike share trip statistics as JSON.
+
+Each city's summary file is aggregated once at startup (in a process pool,
+off the event loop) and the JSON responses are prepared up front, so a
+request is a dictionary lookup. The summary files are polled for changes and
+a city is recomputed in the background when its file is replaced; until the
+new numbers are ready the previous ones keep being served.
+
+    python bikeshare_service.py --port 8080
+
+Endpoints (GET):
+    /cities                           cities and whether their data is loaded
+    /cities/<city>                    all statistics of a city
+    /cities/<city>/number_of_trips    number_of_trips() as named fields
+    /cities/<city>/length_of_trips    length_of_trips() as named fields
+    /cities/<city>/trip_month         trip_month() as named fields
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import Bike_Share_Project as bs
+
+
+# field names of the tuples returned by the analysis functions #
+number_of_trips_fields = ('n_subscribers', 'n_customers', 'n_total', 'pct_subs',
+                          'pct_custs', 'avg_subs_ride', 'avg_cust_ride')
+length_of_trips_fields = ('len_total', 'n_total', 'avg_len', 'pct_long', 'pct_short')
+trip_month_fields = ('subs_season', 'cust_season', 'ratio_season', 'total_season')
+
+status_text = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed',
+               400: 'Bad Request', 503: 'Service Unavailable'}
+
+
+def file_version(filename):
+    """
+    Returns (mtime_ns, size) of a file, or None when it does not exist.
+    """
+    try:
+        source = os.stat(filename)
+    except OSError:
+        return None
+    return (source.st_mtime_ns, source.st_size)
+
+
+def city_statistics(filename):
+    """
+    Computes the statistics of one summary file in a single pass. Runs in a
+    worker process and returns a plain dict ready for JSON.
+    """
+    summary = bs.trip_summary(filename)
+    return {'number_of_trips': {f: getattr(summary, f) for f in number_of_trips_fields},
+            'length_of_trips': {f: getattr(summary, f) for f in length_of_trips_fields},
+            'trip_month': {f: getattr(summary, f) for f in trip_month_fields}}
+
+
+def _json_body(data):
+    return json.dumps(data, sort_keys=True).encode()
+
+
+def new_state(summary_files):
+    """
+    Returns the service state: for every city its summary file, the file
+    version the statistics were computed from and the prepared responses.
+    """
+    return {city: {'file': filename, 'version': None, 'responses': None, 'error': None}
+            for city, filename in summary_files.items()}
+
+
+async def refresh_city(state, city, executor):
+    """
+    Recomputes a city's statistics in the executor when its summary file
+    changed since the last computation, then swaps in the new responses.
+    """
+    entry = state[city]
+    version = file_version(entry['file'])
+    if version is None or version == entry['version']:
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        stats = await loop.run_in_executor(executor, city_statistics, entry['file'])
+    except Exception as error:
+        entry['error'] = '{}: {}'.format(type(error).__name__, error)
+        entry['version'] = version
+        return
+    responses = {name: _json_body(values) for name, values in stats.items()}
+    responses[None] = _json_body(stats)
+    entry['responses'] = responses
+    entry['version'] = version
+    entry['error'] = None
+
+
+async def watch_files(state, executor, interval):
+    """
+    Polls every summary file and hot-reloads the cities whose file changed.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.gather(*(refresh_city(state, city, executor) for city in state))
+
+
+def route(state, path):
+    """
+    Returns (status, body) for a GET of path.
+    """
+    parts = [p for p in path.split('?', 1)[0].split('/') if p]
+    if parts == ['cities']:
+        return 200, _json_body({city: {'loaded': entry['responses'] is not None,
+                                       'error': entry['error']}
+                                for city, entry in state.items()})
+    if len(parts) in (2, 3) and parts[0] == 'cities' and parts[1] in state:
+        entry = state[parts[1]]
+        if entry['responses'] is None:
+            return 503, _json_body({'error': entry['error'] or 'statistics not loaded yet'})
+        name = parts[2] if len(parts) == 3 else None
+        if name in entry['responses']:
+            return 200, entry['responses'][name]
+    return 404, _json_body({'error': 'not found'})
+
+
+async def handle_client(state, reader, writer):
+    """
+    Serves HTTP/1.1 requests on one connection, keeping it open unless the
+    client asks to close it.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip().lower()
+
+            try:
+                method, path, version = request_line.decode('latin-1').split()
+            except ValueError:
+                status, body, method = 400, _json_body({'error': 'bad request'}), 'GET'
+            else:
+                if method in ('GET', 'HEAD'):
+                    status, body = route(state, path)
+                else:
+                    status, body = 405, _json_body({'error': 'method not allowed'})
+
+            keep_alive = (headers.get('connection') != 'close'
+                          and not request_line.rstrip().endswith(b'HTTP/1.0'))
+            head = ('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n'
+                    'Content-Length: {}\r\nConnection: {}\r\n\r\n'
+                    .format(status, status_text[status], len(body),
+                            'keep-alive' if keep_alive else 'close')).encode()
+            writer.write(head if method == 'HEAD' else head + body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_service(summary_files, executor, host='127.0.0.1', port=8080,
+                        reload_interval=2.0):
+    """
+    Loads every city, starts the HTTP server and the file watcher, and
+    returns (server, state, watcher). Statistics are computed in executor,
+    which the caller owns: shut it down after closing the server and
+    cancelling the watcher. Use port=0 to pick a free port (see
+    server.sockets[0].getsockname()).
+    """
+    state = new_state(summary_files)
+    await asyncio.gather(*(refresh_city(state, city, executor) for city in state))
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(state, reader, writer), host, port)
+    watcher = asyncio.create_task(watch_files(state, executor, reload_interval))
+    return server, state, watcher
+
+
+async def serve(summary_files, host, port, reload_interval, workers):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        server, state, watcher = await start_service(summary_files, executor, host, port,
+                                                     reload_interval)
+        address = server.sockets[0].getsockname()
+        print('serving trip statistics on http://{}:{}/cities'.format(address[0], address[1]))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help='seconds between checks for changed summary files')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes used to compute statistics')
+    parser.add_argument('--city', action='append', default=[], metavar='CITY=FILE',
+                        help='serve CITY from summary FILE instead of the ./data files')
+    args = parser.parse_args(argv)
+
+    summary_files = dict(bs.summary_files)
+    for item in args.city:
+        city, _, filename = item.partition('=')
+        summary_files[city] = filename
+    try:
+        asyncio.run(serve(summary_files, args.host, args.port,
+                          args.reload_interval, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,546 @@
+"""
+Regression tests for the bike share pipeline, run on small synthetic raw
+files from benchmark.synthetic_rows().
+
+    python -m pytest -q
+"""
+
+import asyncio
+import csv
+import json
+import math
+import os
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+import Bike_Share_Project as bs
+import bikeshare_service
+from benchmark import raw_columns, synthetic_rows
+
+cities = ['NYC', 'Chicago', 'Washington']
+n_rows = 2000
+
+# time formats of the raw files, as the original helpers parsed them #
+reference_formats = {'NYC': "%m/%d/%Y %H:%M:%S", 'Chicago': "%m/%d/%Y %H:%M",
+                     'Washington': "%m/%d/%Y %H:%M"}
+
+
+def reference_condense(in_file, out_file, city):
+    """
+    The original condense_data(): DictReader, strptime per row and the
+    header written by DictWriter, so the optimized paths can be compared
+    byte for byte.
+    """
+    with open(out_file, 'w') as f_out, open(in_file, 'r') as f_in:
+        csv.DictWriter(f_out, fieldnames=['duration', 'month', 'hour', 'day_of_week',
+                                          'user_type']).writeheader()
+        for row in csv.DictReader(f_in):
+            if city == 'Washington':
+                duration = int(row['Duration (ms)']) / 60000
+                user_type = 'Subscriber' if row['Member Type'] == 'Registered' else 'Customer'
+                start = row['Start date']
+            else:
+                duration = int(row['tripduration']) / 60
+                user_type = row['usertype']
+                start = row['starttime']
+            d = datetime.strptime(start, reference_formats[city])
+            f_out.write("{},{},{},{},{}\n".format(duration, int(d.strftime("%m")),
+                                                  int(d.strftime("%H")), d.strftime("%A"),
+                                                  user_type))
+
+
+@pytest.fixture(autouse=True)
+def no_result_cache(monkeypatch):
+    # every test computes its results instead of reading old pickles #
+    monkeypatch.setattr(bs, 'result_cache_dir', None)
+
+
+@pytest.fixture(scope='module')
+def raw_files(tmp_path_factory):
+    """
+    Writes a synthetic raw file per city and its reference summary.
+    Returns {city: (raw, reference summary)}.
+    """
+    folder = tmp_path_factory.mktemp('raw')
+    files = {}
+    for city in cities:
+        raw = str(folder / '{}-raw.csv'.format(city))
+        with open(raw, 'w', newline='') as f_out:
+            writer = csv.writer(f_out, lineterminator='\n')
+            writer.writerow(raw_columns[city])
+            writer.writerows(synthetic_rows(city, n_rows, seed=1))
+        reference = str(folder / '{}-reference.csv'.format(city))
+        reference_condense(raw, reference, city)
+        files[city] = (raw, reference)
+    return files
+
+
+def read_bytes(filename):
+    with open(filename, 'rb') as f_in:
+        return f_in.read()
+
+
+def assert_summaries_close(a, b):
+    for field in bs.TripSummary._fields:
+        x, y = getattr(a, field), getattr(b, field)
+        if field == 'duration_sketches':
+            assert x == y
+        elif isinstance(x, dict):
+            assert x.keys() == y.keys()
+            assert all(math.isclose(x[k], y[k]) for k in x)
+        else:
+            assert math.isclose(x, y), field
+
+
+@pytest.mark.parametrize('city', cities)
+def test_condense_data_matches_reference(raw_files, tmp_path, city):
+    raw, reference = raw_files[city]
+    out = str(tmp_path / 'summary.csv')
+    stats = bs.condense_data(raw, out, city, batch_size=333)
+    assert stats.rows == n_rows
+    assert read_bytes(out) == read_bytes(reference)
+
+
+@pytest.mark.parametrize('city', cities)
+def test_condense_parallel_matches_reference(raw_files, tmp_path, city):
+    raw, reference = raw_files[city]
+    out = str(tmp_path / 'summary.csv')
+    bs.condense_parallel({city: {'in_file': raw, 'out_file': out}}, workers=2,
+                         chunk_bytes=20000)
+    assert read_bytes(out) == read_bytes(reference)
+
+
+def test_condense_parallel_failure_keeps_output(raw_files, tmp_path):
+    raw, reference = raw_files['Washington']
+    with open(raw, 'r') as f_in:
+        lines = f_in.readlines()
+    fields = lines[1500].split(',')
+    fields[0] = 'not a duration'
+    lines[1500] = ','.join(fields)
+    broken = str(tmp_path / 'broken.csv')
+    with open(broken, 'w') as f_out:
+        f_out.writelines(lines)
+
+    out = str(tmp_path / 'summary.csv')
+    shutil.copy(reference, out)
+    with pytest.raises(ValueError):
+        bs.condense_parallel({'Washington': {'in_file': broken, 'out_file': out}},
+                             workers=2, chunk_bytes=20000)
+    # the old summary survives and no part or temporary files are left #
+    assert read_bytes(out) == read_bytes(reference)
+    assert sorted(os.listdir(str(tmp_path))) == ['broken.csv', 'summary.csv']
+
+
+@pytest.mark.parametrize('city', cities)
+def test_condense_pandas_matches_reference(raw_files, tmp_path, city):
+    pytest.importorskip('pandas')
+    raw, reference = raw_files[city]
+    out = str(tmp_path / 'summary.csv')
+    bs.condense_data_pandas(raw, out, city, chunksize=700)
+    assert read_bytes(out) == read_bytes(reference)
+
+
+def test_ingest_incremental_matches_condense(raw_files, tmp_path):
+    raw, reference = raw_files['NYC']
+    with open(raw, 'r') as f_in:
+        lines = f_in.readlines()
+    part1, part2 = str(tmp_path / 'part1.csv'), str(tmp_path / 'part2.csv')
+    with open(part1, 'w') as f_out:
+        f_out.writelines(lines[:1200])
+    with open(part2, 'w') as f_out:
+        f_out.writelines(lines[:1] + lines[1200:])
+
+    out, state = str(tmp_path / 'summary.csv'), str(tmp_path / 'state.json')
+    bs.ingest_incremental([part1], out, 'NYC', state, batch_size=100)
+    summary = bs.ingest_incremental([part1, part2], out, 'NYC', state, batch_size=100)
+    assert read_bytes(out) == read_bytes(reference)
+    assert_summaries_close(summary, bs.trip_summary(reference))
+
+
+def test_ingest_incremental_rolls_back_a_failed_run(raw_files, tmp_path):
+    raw, reference = raw_files['Chicago']
+    with open(raw, 'r') as f_in:
+        lines = f_in.readlines()
+    part1, part2 = str(tmp_path / 'part1.csv'), str(tmp_path / 'part2.csv')
+    with open(part1, 'w') as f_out:
+        f_out.writelines(lines[:1001])
+    broken = lines[:1] + lines[1001:]
+    fields = broken[600].split(',')
+    fields[4] = 'not a duration'
+    broken[600] = ','.join(fields)
+    with open(part2, 'w') as f_out:
+        f_out.writelines(broken)
+
+    out, state = str(tmp_path / 'summary.csv'), str(tmp_path / 'state.json')
+    bs.ingest_incremental([part1], out, 'Chicago', state, batch_size=100)
+    # part2 fails after several batches were already appended #
+    with pytest.raises(ValueError):
+        bs.ingest_incremental([part1, part2], out, 'Chicago', state, batch_size=100)
+
+    with open(part2, 'w') as f_out:
+        f_out.writelines(lines[:1] + lines[1001:])
+    summary = bs.ingest_incremental([part1, part2], out, 'Chicago', state, batch_size=100)
+    assert summary.n_total == n_rows
+    assert read_bytes(out) == read_bytes(reference)
+
+
+def test_ingest_incremental_refuses_unaccounted_summary(raw_files, tmp_path):
+    raw, reference = raw_files['NYC']
+    out = str(tmp_path / 'existing.csv')
+    with open(out, 'wb') as f_out:
+        f_out.write(read_bytes(reference))
+    with pytest.raises(ValueError):
+        bs.ingest_incremental([raw], out, 'NYC', str(tmp_path / 'state.json'))
+    assert read_bytes(out) == read_bytes(reference)
+
+@pytest.mark.parametrize('city', cities)
+def test_trip_summary_matches_original_functions(raw_files, city):
+    reference = raw_files[city][1]
+    summary = bs.trip_summary(reference)
+    assert tuple(summary[:7]) == pytest.approx(bs.number_of_trips(reference))
+    len_total, n_total, avg_len, pct_long, pct_short = bs.length_of_trips(reference)
+    assert (summary.len_total, summary.n_total, summary.avg_len, summary.pct_long,
+            summary.pct_short) == pytest.approx((len_total, n_total, avg_len, pct_long, pct_short))
+    subs_season, cust_season, ratio_season, total_season = bs.trip_month(reference)
+    assert summary.subs_season == subs_season
+    assert summary.cust_season == cust_season
+    assert summary.total_season == total_season
+    assert summary.ratio_season == pytest.approx(ratio_season)
+
+
+@pytest.mark.parametrize('city', cities)
+def test_trip_summary_parallel_matches_trip_summary(raw_files, city):
+    reference = raw_files[city][1]
+    parallel = bs.trip_summary_parallel(reference, workers=2, chunk_bytes=10000)
+    assert_summaries_close(parallel, bs.trip_summary(reference))
+
+
+@pytest.mark.parametrize('city', cities)
+def test_table_matches_trip_summary(raw_files, city):
+    pytest.importorskip('numpy')
+    reference = raw_files[city][1]
+    summary = bs.trip_summary(reference)
+    table = bs.load_trip_table(reference, use_sidecar=False)
+    counts = bs.table_number_of_trips(table)
+    assert counts[:3] == (summary.n_subscribers, summary.n_customers, summary.n_total)
+    # the table keeps durations as float32 #
+    assert counts[5:] == pytest.approx(summary[5:7], rel=1e-6)
+    assert bs.table_trip_month(table)[3] == summary.total_season
+
+
+@pytest.mark.parametrize('city', cities)
+def test_cube_matches_trip_summary(raw_files, city):
+    pytest.importorskip('numpy')
+    reference = raw_files[city][1]
+    summary = bs.trip_summary(reference)
+    cube = bs.build_trip_cube(bs.load_trip_table(reference, use_sidecar=False))
+    assert int(cube.counts.sum()) == summary.n_total
+    by_month = bs.cube_group(cube, 'month')
+    totals = dict.fromkeys(bs.season_names, 0)
+    for month in range(1, 13):
+        totals[bs.season_of_month[month]] += int(by_month[month - 1])
+    assert totals == summary.total_season
+
+
+@pytest.mark.parametrize('city', cities)
+def test_sidecar_round_trip(raw_files, tmp_path, monkeypatch, city):
+    pytest.importorskip('numpy')
+    out = str(tmp_path / 'summary.csv')
+    read_trip_records = bs.read_trip_records
+    with monkeypatch.context() as patch:
+        # the records come from the streamed batches, not a second parse #
+        patch.setattr(bs, 'read_trip_records', None)
+        bs.condense_data(raw_files[city][0], out, city, sidecar=True, batch_size=300)
+    trips, user_types = bs.read_trip_sidecar(out)
+    assert trips is not None
+    parsed, parsed_types = read_trip_records(out)
+    assert user_types == parsed_types
+    assert (trips == parsed).all()
+
+
+def test_sketches_merge_exactly():
+    durations = [0.5 + (i * 7919 % 1000) / 10 for i in range(5000)]
+    whole = bs.new_sketch()
+    first, second = bs.new_sketch(), bs.new_sketch()
+    for i, duration in enumerate(durations):
+        bs.sketch_add(whole, duration)
+        bs.sketch_add(first if i % 3 else second, duration)
+    assert bs.sketch_merge(first, second) == whole
+
+    ordered = sorted(durations)
+    for q in (0.5, 0.9, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert bs.sketch_quantile(whole, q) == pytest.approx(exact, rel=2 * bs.sketch_accuracy)
+
+
+def brute_force_stations(raw, reference, city, hours):
+    """
+    Counts trips and duration sums per origin, destination and route with
+    Counters over the raw rows, for trips starting within hours.
+    """
+    schema = bs.city_schema(city)
+    counts = {'departures': Counter(), 'arrivals': Counter(), 'routes': Counter()}
+    minutes = {'departures': Counter(), 'arrivals': Counter(), 'routes': Counter()}
+    with open(raw) as f_raw, open(reference) as f_ref:
+        for row, trip in zip(csv.DictReader(f_raw), csv.DictReader(f_ref)):
+            if hours is not None and int(trip['hour']) not in hours:
+                continue
+            origin, destination = row[schema['start_station']], row[schema['end_station']]
+            for kind, key in (('departures', origin), ('arrivals', destination),
+                              ('routes', (origin, destination))):
+                counts[kind][key] += 1
+                minutes[kind][key] += float(trip['duration'])
+    return counts, minutes
+
+
+def assert_top_matches(top, counts, minutes, n):
+    # ties may come in any order, so compare the counts and every entry #
+    assert [entry[-2] for entry in top] == sorted(counts.values(), reverse=True)[:n]
+    for *key, trips, average in top:
+        key = key[0] if len(key) == 1 else tuple(key)
+        assert counts[key] == trips
+        assert average == pytest.approx(minutes[key] / trips)
+
+
+def test_station_index_matches_brute_force(raw_files, tmp_path):
+    pytest.importorskip('numpy')
+    raw, reference = raw_files['Chicago']
+    out = str(tmp_path / 'summary.csv')
+    bs.condense_data(raw, out, 'Chicago', stations=True)
+    index = bs.load_station_index(out)
+    assert index is not None
+
+    for hours in (None, range(7, 10)):
+        counts, minutes = brute_force_stations(raw, reference, 'Chicago', hours)
+        for direction in ('departures', 'arrivals'):
+            top = bs.top_stations(index, 15, hours=hours, direction=direction)
+            assert_top_matches(top, counts[direction], minutes[direction], 15)
+        assert_top_matches(bs.top_routes(index, 15, hours=hours),
+                           counts['routes'], minutes['routes'], 15)
+    assert bs.top_stations(index, 3, hours=8) == bs.top_stations(index, 3, hours=[8])
+
+    # rewriting the summary makes the index stale #
+    with open(out, 'a') as f_out:
+        f_out.write('1.0,1,0,Monday,Subscriber\n')
+    assert bs.load_station_index(out) is None
+
+
+def test_profile_records_stages(raw_files, tmp_path):
+    raw, reference = raw_files['NYC']
+    out = str(tmp_path / 'summary.csv')
+    bs.start_profile()
+    try:
+        with pytest.raises(RuntimeError):
+            bs.start_profile()
+        bs.condense_data(raw, out, 'NYC')
+        bs.trip_summary(out)
+        bs.trip_summary(out)
+    finally:
+        profile = bs.stop_profile()
+    with pytest.raises(RuntimeError):
+        bs.stop_profile()
+
+    stages = profile['stages']
+    assert stages['condense_data']['calls'] == 1
+    assert stages['condense_data']['rows'] == n_rows
+    assert stages['condense_data']['bytes_read'] == os.path.getsize(raw)
+    assert stages['condense_data']['bytes_written'] == os.path.getsize(reference)
+    assert stages['condense_data: output writes']['calls'] == 1
+    assert stages['trip_summary']['calls'] == 2
+    assert stages['trip_summary']['rows'] == 2 * n_rows
+    assert stages['trip_summary']['bytes_read'] == 2 * os.path.getsize(out)
+    assert profile['seconds'] >= stages['condense_data']['seconds']
+
+    json_file = str(tmp_path / 'profile.json')
+    bs.write_profile(profile, json_file)
+    with open(json_file) as f_in:
+        assert json.load(f_in) == profile
+    with open(str(tmp_path / 'profile.txt')) as f_in:
+        text = f_in.read()
+    assert text == bs.format_profile(profile) + '\n'
+    condense_line = next(line for line in text.splitlines()
+                         if line.startswith('condense_data '))
+    assert condense_line.split()[1] == '1'
+    assert str(n_rows) in condense_line.split()
+
+
+def with_blank_line(tmp_path, filename):
+    # the same file with a trailing empty line, as some exports have #
+    copy = str(tmp_path / ('blank-' + filename.rsplit('/', 1)[-1]))
+    with open(copy, 'wb') as f_out:
+        f_out.write(read_bytes(filename) + b'\n')
+    return copy
+
+
+@pytest.mark.parametrize('city', cities)
+def test_condense_skips_blank_lines(raw_files, tmp_path, city):
+    raw, reference = raw_files[city]
+    raw = with_blank_line(tmp_path, raw)
+    out = str(tmp_path / 'summary.csv')
+    bs.condense_data(raw, out, city)
+    assert read_bytes(out) == read_bytes(reference)
+    bs.condense_parallel({city: {'in_file': raw, 'out_file': out}}, workers=2,
+                         chunk_bytes=20000)
+    assert read_bytes(out) == read_bytes(reference)
+    bs.ingest_incremental([raw], out + '.ingest', city, str(tmp_path / 'state.json'))
+    assert read_bytes(out + '.ingest') == read_bytes(reference)
+
+
+def test_summary_readers_skip_blank_lines(raw_files, tmp_path):
+    reference = raw_files['Chicago'][1]
+    blank = with_blank_line(tmp_path, reference)
+    assert_summaries_close(bs.trip_summary(blank), bs.trip_summary(reference))
+    assert_summaries_close(bs.trip_summary_parallel(blank, workers=2, chunk_bytes=10000),
+                           bs.trip_summary(reference))
+    pytest.importorskip('numpy')
+    assert len(bs.read_trip_records(blank)[0]) == n_rows
+
+
+def test_sample_data_is_reproducible(raw_files, tmp_path):
+    raw = raw_files['Chicago'][0]
+    a, b = str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')
+    for method in ('reservoir', 'stratified'):
+        info = bs.sample_data(raw, a, 'Chicago', 240, method=method, seed=3)
+        bs.sample_data(raw, b, 'Chicago', 240, method=method, seed=3)
+        assert read_bytes(a) == read_bytes(b)
+        assert info['population'] == n_rows
+        assert info['sample'] <= 240
+        estimates = bs.sample_estimates(a)
+        assert estimates['n_total'].value == n_rows
+        assert estimates['pct_subs'].low <= estimates['pct_subs'].value <= estimates['pct_subs'].high
+
+
+@pytest.fixture
+def result_cache(monkeypatch, tmp_path):
+    # a private, enabled result cache instead of the disabled default #
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(bs, 'result_cache_dir', cache_dir)
+    return cache_dir
+
+
+def test_result_cache_hits_and_misses(result_cache, tmp_path):
+    calls = []
+
+    def size(filename):
+        calls.append(filename)
+        return os.path.getsize(filename)
+    cached = bs.cached_result(size)
+
+    data = str(tmp_path / 'data.csv')
+    with open(data, 'w') as f_out:
+        f_out.write('a,b\n1,2\n')
+    assert cached(data) == 8
+    assert cached(data) == 8
+    assert len(calls) == 1
+
+    # a changed file misses #
+    with open(data, 'w') as f_out:
+        f_out.write('a,b\n1,2\n3,4\n')
+    assert cached(data) == 12
+    assert len(calls) == 2
+
+    # a changed function body misses, even under the same name #
+    def size(filename):
+        calls.append(filename)
+        return os.path.getsize(filename) + 1
+    assert bs.cached_result(size)(data) == 13
+    assert len(calls) == 3
+
+    # so does a changed inner function #
+    def size(filename):
+        calls.append(filename)
+        return sum(1 for _ in (line for line in open(filename) if line))
+    first = bs.cached_result(size)(data)
+
+    def size(filename):
+        calls.append(filename)
+        return sum(1 for _ in (line for line in open(filename) if not line))
+    assert bs.cached_result(size)(data) != first
+    assert len(calls) == 5
+
+
+def test_result_cache_evicts_least_recently_used(result_cache, tmp_path, monkeypatch):
+    calls = []
+
+    def payload(filename):
+        calls.append(filename)
+        return b'x' * 1000
+    cached = bs.cached_result(payload)
+
+    a, b, c = (str(tmp_path / (name + '.csv')) for name in 'abc')
+    for name in (a, b, c):
+        with open(name, 'w') as f_out:
+            f_out.write(name)
+
+    # room for two entries; sleeps keep the mtimes apart #
+    monkeypatch.setattr(bs, 'result_cache_max_bytes', 2500)
+    for name in (a, b, a, c):
+        cached(name)
+        time.sleep(0.02)
+    assert calls == [a, b, c]
+    assert len([name for name in os.listdir(result_cache) if name.endswith('.pkl')]) == 2
+
+    # a was used after b, so b was evicted #
+    cached(a)
+    assert calls == [a, b, c]
+    cached(b)
+    assert calls == [a, b, c, b]
+
+
+async def http_get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('GET {} HTTP/1.1\r\nConnection: close\r\n\r\n'.format(path).encode())
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_service_serves_and_reloads(raw_files, tmp_path):
+    summary = str(tmp_path / 'Chicago.csv')
+    shutil.copy(raw_files['Chicago'][1], summary)
+    summary_files = {'Chicago': summary, 'Nowhere': str(tmp_path / 'missing.csv')}
+
+    async def scenario(executor):
+        server, state, watcher = await bikeshare_service.start_service(
+            summary_files, executor, port=0, reload_interval=0.02)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            status, cities = await http_get(port, '/cities')
+            assert status == 200
+            assert cities['Chicago'] == {'loaded': True, 'error': None}
+            assert cities['Nowhere']['loaded'] is False
+
+            status, trips = await http_get(port, '/cities/Chicago/number_of_trips')
+            assert status == 200
+            assert trips['n_total'] == n_rows
+            assert trips['n_subscribers'] == bs.number_of_trips(summary)[0]
+
+            assert (await http_get(port, '/cities/Chicago/nothing'))[0] == 404
+            assert (await http_get(port, '/cities/Atlantis'))[0] == 404
+            assert (await http_get(port, '/cities/Nowhere'))[0] == 503
+
+            # replace the summary with its first 500 trips #
+            with open(raw_files['Chicago'][1]) as f_in:
+                lines = f_in.readlines()
+            with open(summary, 'w') as f_out:
+                f_out.writelines(lines[:501])
+            for _ in range(250):
+                await asyncio.sleep(0.02)
+                status, trips = await http_get(port, '/cities/Chicago/number_of_trips')
+                if trips['n_total'] != n_rows:
+                    break
+            assert status == 200
+            assert trips['n_total'] == 500
+        finally:
+            watcher.cancel()
+            server.close()
+            await server.wait_closed()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        asyncio.run(scenario(executor))